@@ -0,0 +1,53 @@
+"""
+Cache Policy
+Declarative Cache-Control rules per route, applied by CachePolicyMiddleware
+
+Anything not listed is tenant data or an action and gets NO_STORE, so a new
+view is never cached by accident. Static files never get here: WhiteNoise
+answers them first with its own headers (see WHITENOISE_MAX_AGE).
+"""
+
+# Never written to any cache: pages and actions carrying tenant data or CSRF tokens
+NO_STORE = 'no-store'
+# Only the user's browser may keep it, and must revalidate (ETag) before reuse
+PRIVATE = 'private, no-cache'
+# Anonymous pages a shared cache may keep, and serve stale while it refetches
+PUBLIC_PAGE = 'public, max-age=300, stale-while-revalidate=86400'
+
+DEFAULT_POLICY = NO_STORE
+
+# URL name -> policy for successful GET/HEAD responses
+ROUTE_POLICIES = {
+    # JSON read APIs that the browser revalidates with conditional requests
+    'get_guests': PRIVATE,
+    'get_available_rooms': PRIVATE,
+    'get_availability': PRIVATE,
+    'get_room_details': PRIVATE,
+    'get_room_tenants': PRIVATE,
+    'get_payment_history': PRIVATE,
+    'get_electricity_history': PRIVATE,
+    'occupancy_calendar': PRIVATE,
+}
+
+# URL names served as PUBLIC_PAGE to anonymous users; signed-in users get PRIVATE
+# because the page shows different links to them
+PUBLIC_ROUTES = {'home'}
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+CACHEABLE_STATUSES = (200, 203, 204, 206, 304)
+
+
+def policy_for(request, response):
+    """Cache-Control value for a response the view left without one"""
+    if request.method not in CACHEABLE_METHODS or response.status_code not in CACHEABLE_STATUSES:
+        return NO_STORE
+
+    match = getattr(request, 'resolver_match', None)
+    url_name = match.url_name if match else None
+    if url_name in PUBLIC_ROUTES:
+        user = getattr(request, 'user', None)
+        # A shared cache must never store a Set-Cookie
+        if response.cookies or (user is not None and user.is_authenticated):
+            return PRIVATE
+        return PUBLIC_PAGE
+    return ROUTE_POLICIES.get(url_name, DEFAULT_POLICY)
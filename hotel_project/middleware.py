@@ -1,84 +1,236 @@
+import logging
+import re
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.conf import settings
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from .cache_policy import policy_for
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Paths anonymous users may open. Exact entries must match the whole path;
+# prefix entries match anything below them. API views enforce login themselves.
+LOGIN_EXEMPT_PATHS = (
+    '/',
+    '/favicon.ico',
+    '/apple-touch-icon.png',
+    '/apple-touch-icon-precomposed.png',
+)
+LOGIN_EXEMPT_PREFIXES = (
+    '/login/', '/logout/', '/admin/', '/health/', '/api/',
+)
+
+
+def compile_login_whitelist(paths, prefixes):
+    """One regex for the whole whitelist, so a request costs a single match"""
+    alternatives = [re.escape(path) + r'\Z' for path in paths] + [re.escape(prefix) for prefix in prefixes]
+    return re.compile('|'.join(alternatives))
+
 
 class LoginRequiredMiddleware:
     """Middleware that redirects anonymous users to login for most pages.
 
-    Whitelist: '/', '/login/', '/logout/', '/admin/', static and media files.
+    Whitelist: LOGIN_EXEMPT_PATHS and LOGIN_EXEMPT_PREFIXES plus static and
+    media files, compiled once at startup. Exempt requests never touch
+    request.user, so the session is only loaded if the view needs it.
     """
     def __init__(self, get_response):
         self.get_response = get_response
+        prefixes = LOGIN_EXEMPT_PREFIXES + tuple(
+            url if url.startswith('/') else '/' + url
+            for url in (settings.STATIC_URL, settings.MEDIA_URL) if url and '://' not in url
+        )
+        self.exempt = compile_login_whitelist(LOGIN_EXEMPT_PATHS, prefixes).match
 
     def __call__(self, request):
         # Skip middleware during testing
         if getattr(settings, 'TESTING', False):
             return self.get_response(request)
-            
-        path = request.path_info
-        # Allow safe paths without login
-        media_prefix = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else '/' + settings.MEDIA_URL
-        allowed_prefixes = [
-            '/login/', '/logout/', '/admin/', '/static/', '/health/', '/api/', media_prefix,
-            '/',
-        ]
-
-        if any(path.startswith(p) for p in allowed_prefixes):
+
+        if self.exempt(request.path_info) or request.user.is_authenticated:
             return self.get_response(request)
 
         # If user is not authenticated, redirect to login
-        if not request.user.is_authenticated:
-            return redirect(settings.LOGIN_URL)
+        return redirect(settings.LOGIN_URL)
+
+def build_security_headers():
+    """The (name, value) pairs SecurityHeadersMiddleware adds, from settings"""
+    headers = {
+        'Content-Security-Policy': ' '.join(
+            f'{directive} {sources};' for directive, sources in settings.CONTENT_SECURITY_POLICY.items()
+        ),
+        'Permissions-Policy': ', '.join(f'{feature}=()' for feature in settings.PERMISSIONS_POLICY_DISABLED),
+    }
+    headers.update(settings.EXTRA_RESPONSE_HEADERS)
+    return tuple(headers.items())
 
-        return self.get_response(request)
 
-class SecurityHeadersMiddleware(MiddlewareMixin):
+class SecurityHeadersMiddleware:
     """
-    Add security headers to prevent CSS violations and improve security.
-    Complies with OWASP recommendations.
+    Add the CSP, Permissions-Policy and extra headers from settings to every response.
+
+    The header values are built once when the server starts. Headers Django's
+    SecurityMiddleware and XFrameOptionsMiddleware already send are configured
+    through their settings instead. Works in both sync and async stacks.
     """
-    
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.headers = build_security_headers()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(await self.get_response(request))
+
+    def add_headers(self, response):
+        for name, value in self.headers:
+            response.headers[name] = value
+        return response
+
+
+class CachePolicyMiddleware(MiddlewareMixin):
+    """
+    Set Cache-Control from the per-route table in cache_policy.py.
+
+    Sits outside the session and CSRF middleware so it sees the cookies they
+    set. Responses that already carry Cache-Control (never_cache, admin) keep it.
+    """
+
     def process_response(self, request, response):
-        """Add security headers to response"""
-        
-        # Content Security Policy - expanded for Google Fonts
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline'; "
-            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://fonts.gstatic.com; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' data: https://fonts.googleapis.com https://fonts.gstatic.com; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none'; "
-            "base-uri 'self'; "
-            "form-action 'self';"
-        )
-        response['Content-Security-Policy'] = csp
-        
-        # Additional security headers
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-Frame-Options'] = 'DENY'
-        response['X-XSS-Protection'] = '1; mode=block'
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        response['Permissions-Policy'] = (
-            'geolocation=(), '
-            'microphone=(), '
-            'camera=(), '
-            'payment=(), '
-            'usb=(), '
-            'magnetometer=(), '
-            'gyroscope=(), '
-            'accelerometer=()'
-        )
-        
-        # Performance headers
-        response['Cache-Control'] = 'public, max-age=3600'
-        
-        # Opt-in to browser features for better performance
-        response['Accept-CH'] = 'DPR, Viewport-Width, Width'
-        
-        # Only add HTTPS-related headers in production
-        if not settings.DEBUG:
-            response['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-        
+        if not response.has_header('Cache-Control'):
+            response['Cache-Control'] = policy_for(request, response)
+        return response
+
+
+def parse_accept_encoding(header):
+    """{coding: q-value} from an Accept-Encoding header"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+class CompressionStats:
+    """Running totals of bytes before and after compression in this process, per encoding"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def record(self, encoding, original, compressed):
+        with self.lock:
+            responses, total_in, total_out = self.totals.get(encoding, (0, 0, 0))
+            self.totals[encoding] = (responses + 1, total_in + original, total_out + compressed)
+
+    def snapshot(self):
+        """{encoding: {'responses', 'bytes_in', 'bytes_out', 'ratio'}}; ratio is bytes out per byte in"""
+        with self.lock:
+            return {
+                encoding: {
+                    'responses': responses,
+                    'bytes_in': total_in,
+                    'bytes_out': total_out,
+                    'ratio': round(total_out / total_in, 3) if total_in else None,
+                }
+                for encoding, (responses, total_in, total_out) in self.totals.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress dynamic text responses with brotli (when installed) or gzip.
+
+    Only COMPRESSION_CONTENT_TYPES of at least COMPRESSION_MIN_SIZE bytes are
+    compressed, and only if the result is smaller. A response that rendered a
+    CSRF token is always gzipped with random padding, the same defence Django's
+    GZipMiddleware uses against BREACH, since brotli output cannot be padded.
+    Sizes are logged at DEBUG and added to compression_stats.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        self.content_types = frozenset(settings.COMPRESSION_CONTENT_TYPES)
+        self.max_random_bytes = settings.COMPRESSION_MAX_RANDOM_BYTES
+
+    def choose_encoding(self, request, csrf_in_body):
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        fallback = accepted.get('*', 0)
+        if brotli is not None and not csrf_in_body and accepted.get('br', fallback) > 0:
+            return 'br'
+        if accepted.get('gzip', fallback) > 0:
+            return 'gzip'
+        return None
+
+    def process_response(self, request, response):
+        if response.streaming or response.status_code in (204, 304) or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if content_type not in self.content_types or len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # get_token() leaves this key behind whenever a token was rendered
+        csrf_in_body = 'CSRF_COOKIE_NEEDS_UPDATE' in request.META
+        encoding = self.choose_encoding(request, csrf_in_body)
+        if encoding is None:
+            return response
+
+        original = response.content
+        if encoding == 'br':
+            compressed = brotli.compress(original, quality=5)
+        else:
+            compressed = compress_string(original, max_random_bytes=self.max_random_bytes if csrf_in_body else None)
+        if len(compressed) >= len(original):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # The bytes changed, so a strong ETag must become weak (RFC 9110 8.8.1);
+        # weak If-None-Match comparison still matches it
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        compression_stats.record(encoding, len(original), len(compressed))
+        logger.debug('%s %s: %d -> %d bytes (%.0f%%)', encoding, request.path, len(original), len(compressed),
+                     100 * len(compressed) / len(original))
         return response
@@ -67,6 +67,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'hotel_project.middleware.CompressionMiddleware',
+    'hotel_project.middleware.CachePolicyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -130,6 +132,37 @@ else:
     }
     print(f"[SETTINGS] SQLITE DB PATH: {DATABASES['default']['NAME']}")
 
+# Cache
+# Redis (or any Redis-compatible server, e.g. a local valkey) when REDIS_URL is set.
+# Otherwise locmem in development and a file cache in production, so every gunicorn
+# worker sees the same generation counters (locmem is per-process). Only Redis bumps
+# those counters atomically; use it when several workers write concurrently.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 300))
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'hotel-rental',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', '/tmp/hotel_rental_cache'),
+        }
+    }
+CACHES['default']['TIMEOUT'] = CACHE_TIMEOUT
+CACHES['default']['KEY_PREFIX'] = 'hotel'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -196,6 +229,10 @@ STORAGES = {
 WHITENOISE_MANIFEST_STRICT = False
 WHITENOISE_USE_FINDERS = True
 WHITENOISE_AUTOREFRESH = DEBUG
+# WhiteNoise serves /static/ before any other middleware runs, so it owns the
+# Cache-Control there: hashed names from the manifest storage are sent as
+# immutable for ten years, everything else for this many seconds
+WHITENOISE_MAX_AGE = 0 if DEBUG else 3600
 
 # Media files (Uploads) - for guest documents, ID proofs, etc.
 MEDIA_URL = '/media/'
@@ -230,18 +267,51 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
-    # Other recommended headers
-    SECURE_REFERRER_POLICY = 'no-referrer-when-downgrade'
-    
-    # Extra Security Headers
-    SECURE_BROWSER_XSS_FILTER = True
-    SECURE_CONTENT_TYPE_NOSNIFF = True
-    X_FRAME_OPTIONS = 'DENY'
 else:
     # Development settings
     CSRF_COOKIE_HTTPONLY = False
     SESSION_COOKIE_HTTPONLY = False
 
+# Response security headers. SecurityMiddleware sends nosniff, Referrer-Policy and
+# (in production, over HTTPS) HSTS; XFrameOptionsMiddleware sends X-Frame-Options.
+SECURE_CONTENT_TYPE_NOSNIFF = True
+SECURE_REFERRER_POLICY = 'strict-origin-when-cross-origin'
+X_FRAME_OPTIONS = 'DENY'
+
+# The rest are built once at startup by hotel_project.middleware.SecurityHeadersMiddleware
+CONTENT_SECURITY_POLICY = {
+    'default-src': "'self'",
+    'script-src': "'self' 'unsafe-inline'",
+    # Google Fonts
+    'style-src': "'self' 'unsafe-inline' https://fonts.googleapis.com https://fonts.gstatic.com",
+    'img-src': "'self' data: https:",
+    'font-src': "'self' data: https://fonts.googleapis.com https://fonts.gstatic.com",
+    'connect-src': "'self'",
+    'frame-ancestors': "'none'",
+    'base-uri': "'self'",
+    'form-action': "'self'",
+}
+# Browser features no page may use (Permissions-Policy)
+PERMISSIONS_POLICY_DISABLED = [
+    'geolocation', 'microphone', 'camera', 'payment', 'usb', 'magnetometer', 'gyroscope', 'accelerometer',
+]
+EXTRA_RESPONSE_HEADERS = {
+    'X-XSS-Protection': '1; mode=block',
+    # Opt-in to client hints for responsive images
+    'Accept-CH': 'DPR, Viewport-Width, Width',
+}
+
+# Dynamic response compression (hotel_project.middleware.CompressionMiddleware).
+# Brotli is used when the optional `brotli` package is installed, gzip otherwise;
+# WhiteNoise serves static files precompressed.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_CONTENT_TYPES = [
+    'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript', 'application/json',
+    'image/svg+xml',
+]
+# Upper bound of the random gzip padding added to responses carrying a CSRF token
+COMPRESSION_MAX_RANDOM_BYTES = 100
+
 # Basic logging for production troubleshooting
 LOG_LEVEL = os.environ.get('DJANGO_LOG_LEVEL', 'INFO' if DEBUG else 'WARNING')
 LOGGING = {
@@ -1,12 +1,24 @@
+from datetime import date
+
 from django.contrib import admin
-from .models import Room, Booking, Guest, MonthlyPayment, PaymentRecord, ElectricityBill
+from .models import Room, Booking, Guest, MonthlyPayment, PaymentRecord, ElectricityBill, JobRun
+from .occupancy import refresh_occupancy
+from .billing import generate_monthly_rent
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ('number', 'room_type', 'price', 'agreed_rent', 'is_available')
+    list_display = ('number', 'room_type', 'price', 'agreed_rent', 'capacity', 'occupancy', 'is_available')
     list_filter = ('room_type', 'is_available')
     search_fields = ('number',)
     fields = ('number', 'room_type', 'price', 'agreed_rent', 'is_available')
+    actions = ['generate_current_month_rent']
+
+    @admin.action(description="Generate this month's rent for selected occupied rooms")
+    def generate_current_month_rent(self, request, queryset):
+        today = date.today()
+        month = date(today.year, today.month, 1)
+        created = generate_monthly_rent(month, rooms=queryset)
+        self.message_user(request, f"Created {created} rent rows for {month:%B %Y}.")
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -40,6 +52,21 @@ class GuestAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        old_room_id = form.initial.get('room') if change else None
+        super().save_model(request, obj, form, change)
+        refresh_occupancy(old_room_id, obj.room_id)
+
+    def delete_model(self, request, obj):
+        room_id = obj.room_id
+        super().delete_model(request, obj)
+        refresh_occupancy(room_id)
+
+    def delete_queryset(self, request, queryset):
+        room_ids = list(queryset.values_list('room_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_occupancy(*room_ids)
+
 @admin.register(MonthlyPayment)
 class MonthlyPaymentAdmin(admin.ModelAdmin):
     list_display = ('room', 'month', 'rent_amount', 'paid_amount', 'payment_status', 'paid_date')
@@ -98,3 +125,9 @@ class ElectricityBillAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'started_at', 'duration_ms', 'rows_changed')
+    list_filter = ('job',)
+    readonly_fields = ('job', 'started_at', 'duration_ms', 'rows_changed', 'details')
@@ -0,0 +1,71 @@
+"""
+Collection Analytics
+Set-based queries that build the room-by-room collection table
+"""
+
+from decimal import Decimal
+
+from django.db.models import CharField, F, FilteredRelation, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
+
+from .models import Room, Guest
+
+
+def room_collection_rows(month):
+    """
+    Build the collection table for every room in a single query.
+
+    Each row carries the current guest, the rent due for `month`, what has been
+    collected, what is pending and the payment status. Rooms without a
+    MonthlyPayment for the month fall back to agreed_rent, then price.
+    """
+    current_guest = Guest.objects.filter(room=OuterRef('pk'), is_active=True).order_by('-created_at').annotate(
+        display_name=Concat('first_name', Value(' '), 'last_name', output_field=CharField())
+    ).values('display_name')[:1]
+
+    rooms = Room.objects.with_occupancy().annotate(
+        current_payment=FilteredRelation('monthly_payments', condition=Q(monthly_payments__month=month)),
+    ).annotate(
+        guest_name=Subquery(current_guest),
+        monthly_payment_id=F('current_payment__id'),
+        payment_rent=F('current_payment__rent_amount'),
+        payment_paid=F('current_payment__paid_amount'),
+        payment_state=F('current_payment__payment_status'),
+        fallback_rent=Coalesce('agreed_rent', 'price'),
+    ).order_by('number')
+
+    rows = []
+    for room in rooms:
+        if room.monthly_payment_id:
+            monthly_rent = room.payment_rent
+            collected = room.payment_paid
+            pending = monthly_rent - collected
+            payment_status = room.payment_state
+        else:
+            monthly_rent = room.fallback_rent
+            collected = Decimal('0.00')
+            pending = monthly_rent
+            payment_status = 'pending'
+
+        if monthly_rent > 0:
+            collection_percentage = min(int((collected / monthly_rent) * 100), 100)
+        else:
+            collection_percentage = 0
+
+        rows.append({
+            'room_id': room.id,
+            'room_number': room.number,
+            'room_type': room.get_room_type_display(),
+            'is_available': room.is_available,
+            'occupancy': room.occupancy,
+            'free_slots': room.free_slots,
+            'guest_name': room.guest_name or 'Vacant',
+            'monthly_rent': monthly_rent,
+            'collected': collected,
+            'pending': pending,
+            'collection_percentage': collection_percentage,
+            'payment_status': payment_status,
+            'monthly_payment_id': room.monthly_payment_id,
+        })
+    return rows
+
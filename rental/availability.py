@@ -0,0 +1,81 @@
+"""
+Room Availability
+Free slots per room per day over a date range, from bookings and guest stays
+
+A stay occupies a slot from its check-in day up to, but not including, its
+check-out day. An active guest with no check-in (or check-out) date is taken
+to have been in the room since (or to stay in it beyond) the window edge.
+"""
+
+from collections import Counter
+from datetime import timedelta
+from itertools import accumulate
+
+from django.db.models import Q
+
+from .models import Booking, Guest, Room
+
+# Longest window a single query may cover
+AVAILABILITY_MAX_DAYS = 366
+
+
+def stays_overlapping(rooms, start, end):
+    """
+    (room_id, check_in, check_out) for every active stay in `rooms` that
+    overlaps [start, end), one tuple per occupied slot.
+
+    submit_booking writes both a Booking and a Guest for the same stay, so per
+    (room, check_in, check_out) the larger of the two counts is used rather than
+    their sum.
+    """
+    room_ids = rooms.values('pk')
+    bookings = Counter(
+        Booking.objects.filter(is_active=True, room__in=room_ids, check_in__lt=end, check_out__gt=start)
+        .values_list('room_id', 'check_in', 'check_out')
+    )
+    guests = Counter(
+        Guest.objects.filter(
+            Q(check_in_date__lt=end) | Q(check_in_date__isnull=True),
+            Q(check_out_date__gt=start) | Q(check_out_date__isnull=True),
+            is_active=True,
+            room__in=room_ids,
+        ).values_list('room_id', 'check_in_date', 'check_out_date')
+    )
+    for key in bookings.keys() | guests.keys():
+        for _ in range(max(bookings[key], guests[key])):
+            yield key
+
+
+def stay_offsets(check_in, check_out, start, days):
+    """(first, end) day offsets of a stay within a window of `days` days from `start`, clamped to it"""
+    first = 0 if check_in is None else max((check_in - start).days, 0)
+    end = days if check_out is None else min((check_out - start).days, days)
+    return first, end
+
+
+def free_slots(start, end, rooms=None):
+    """
+    Free slots for each room on each day from `start` to `end` (both inclusive).
+
+    Two interval queries fetch the overlapping stays; each stay then adds +1/-1
+    at its edges of a per-room day array and a running sum gives the occupancy,
+    so the cost grows with stays + rooms x days, not with their product.
+    Returns a list of room dicts, each with a `free` list holding one count per day.
+    """
+    if rooms is None:
+        rooms = Room.objects.all()
+    days = (end - start).days + 1
+    window_end = end + timedelta(days=1)
+
+    room_rows = list(rooms.order_by('building', 'number').values('id', 'number', 'building', 'capacity', 'is_available'))
+    edges = {row['id']: [0] * (days + 1) for row in room_rows}
+    for room_id, check_in, check_out in stays_overlapping(rooms, start, window_end):
+        first, last = stay_offsets(check_in, check_out, start, days)
+        if first < last:
+            edges[room_id][first] += 1
+            edges[room_id][last] -= 1
+
+    for row in room_rows:
+        capacity = row['capacity']
+        row['free'] = [max(capacity - occupied, 0) for occupied in accumulate(edges[row['id']][:days])]
+    return room_rows
@@ -0,0 +1,84 @@
+"""
+Monthly Billing
+Generates a month's rent rows for every occupied room in one pass
+"""
+
+from datetime import date
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Guest, MonthlyPayment, Room
+from .cache import PAYMENTS, bump_generation
+from .rollups import rebuild_collection_rollups, refresh_room_collections
+
+
+def month_range(start, end):
+    """First day of every month from start's month up to (not including) end"""
+    year, month = start.year, start.month
+    months = []
+    while date(year, month, 1) < end:
+        months.append(date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def generate_monthly_rent(month, rooms=None):
+    """
+    Create the MonthlyPayment for `month` (first day of the month) for every
+    occupied room, or only the occupied rooms in `rooms` when given.
+
+    Rent is agreed_rent, falling back to price, resolved in SQL. Rooms already
+    billed for the month are left untouched: the (room, month) unique constraint
+    turns those inserts into no-ops. Returns the number of rows created.
+    """
+    if rooms is None:
+        rooms = Room.objects.all()
+    newest_guest = Guest.objects.filter(room=OuterRef('pk'), is_active=True).order_by('-created_at').values('id')[:1]
+    billable = rooms.filter(occupancy__gt=0).annotate(
+        rent=Coalesce('agreed_rent', 'price'),
+        guest_id=Subquery(newest_guest),
+    ).values_list('id', 'rent', 'guest_id')
+
+    with transaction.atomic():
+        existing = MonthlyPayment.objects.filter(month=month).count()
+        MonthlyPayment.objects.bulk_create(
+            [
+                MonthlyPayment(room_id=room_id, guest_id=guest_id, month=month, rent_amount=rent)
+                for room_id, rent, guest_id in billable
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        created = MonthlyPayment.objects.filter(month=month).count() - existing
+        if created:
+            # bulk_create skips signals, so refresh the month's rollups (and cache generation) here
+            rebuild_collection_rollups(month)
+    return created
+
+
+def bill_stay(room, guest, check_in, check_out):
+    """
+    Create the pending MonthlyPayment rows for a stay, one per month from
+    check_in up to check_out, at agreed_rent (falling back to price).
+
+    Months the room is already billed for are fetched in one query and kept;
+    the rest go in with one bulk_create. Call inside the transaction that
+    writes the guest. Returns the months created.
+    """
+    months = month_range(check_in, check_out)
+    billed = set(MonthlyPayment.objects.filter(room=room, month__in=months).values_list('month', flat=True))
+    missing = [month for month in months if month not in billed]
+    if not missing:
+        return []
+
+    rent = room.agreed_rent if room.agreed_rent is not None else room.price
+    MonthlyPayment.objects.bulk_create(
+        [MonthlyPayment(room=room, guest=guest, month=month, rent_amount=rent) for month in missing],
+        ignore_conflicts=True,
+    )
+    # bulk_create skips signals: refresh this room's rollups and the cache generation here
+    refresh_room_collections(room.id, missing)
+    bump_generation(PAYMENTS)
+    return missing
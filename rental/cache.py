@@ -0,0 +1,105 @@
+"""
+Cache Layer
+Versioned cache entries for room, building and dashboard aggregates
+
+Every cached value is keyed on the generation counters of the tables it was
+built from. Writes bump those generations (see signals.py), so an entry built
+from old data is never read again and simply expires.
+"""
+
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+
+# Generation namespaces, one per source table group
+ROOMS = 'rooms'
+GUESTS = 'guests'
+BOOKINGS = 'bookings'
+PAYMENTS = 'payments'
+ELECTRICITY = 'electricity'
+
+_MISSING = object()
+
+
+def _generation_key(namespace):
+    return f'gen:{namespace}'
+
+
+def generations(*namespaces):
+    """Current generation of each namespace, in one cache round trip when warm"""
+    keys = [_generation_key(ns) for ns in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Seed from the clock so a counter that was evicted can't restart at a
+            # value an old entry was stored under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def _bump(namespaces):
+    # Only Redis increments atomically and keeps the key's TTL. Elsewhere incr()
+    # is a get + set with the default TIMEOUT, which would let generations expire,
+    # so write them back without a timeout. Two racing bumps may then land on the
+    # same value, which still differs from the one old entries were stored under.
+    atomic = isinstance(caches['default'], RedisCache)
+    for ns in namespaces:
+        key = _generation_key(ns)
+        if atomic:
+            try:
+                cache.incr(key)
+                continue
+            except ValueError:
+                pass
+        current = cache.get(key)
+        cache.set(key, time.time_ns() if current is None else current + 1, None)
+
+
+def bump_generation(*namespaces):
+    """
+    Invalidate everything cached from these namespaces.
+
+    Inside a transaction the bump is repeated on commit, so a reader that refilled
+    the cache from pre-commit data can't pin it under the new generation.
+    """
+    _bump(namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(namespaces))
+
+
+def versioned_key(name, namespaces):
+    return f"{name}:{'.'.join(str(g) for g in generations(*namespaces))}"
+
+
+def cached(name, namespaces, build, timeout=None):
+    """
+    Return the cached value for `name`, calling build() on a miss.
+
+    `namespaces` lists every table group build() reads; a write to any of them
+    makes the next call rebuild. `timeout` defaults to CACHES['default']['TIMEOUT'].
+    """
+    key = versioned_key(name, namespaces)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = build()
+        if timeout is None:
+            cache.set(key, value)
+        else:
+            cache.set(key, value, timeout)
+    return value
+
+
+def generation_etag(*namespaces):
+    """
+    etag_func for django.views.decorators.http.condition().
+
+    The ETag is the current generation of each namespace, so a matching
+    If-None-Match is answered with a 304 after one cache read, before the view
+    loads or serializes any rows. List every table group the view reads.
+    """
+    def etag(request, *args, **kwargs):
+        return '-'.join(str(generation) for generation in generations(*namespaces))
+    return etag
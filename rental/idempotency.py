@@ -0,0 +1,74 @@
+"""
+Idempotency Keys
+Lets clients retry a POST safely: a repeat of an already-processed request
+(same user, same Idempotency-Key header) gets the stored response back
+instead of running the view again
+"""
+
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = timedelta(hours=24)
+
+
+def _replay(entry):
+    response = HttpResponse(bytes(entry.response_body), status=entry.status_code, content_type=entry.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Honour an Idempotency-Key header on a POST view. Requests without the header
+    run as usual. Responses below 500 are stored for IDEMPOTENCY_TTL; server
+    errors are not, so the client can retry them. Apply below login_required.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+        if not key or request.method != 'POST' or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return JsonResponse({'success': False, 'message': f'{IDEMPOTENCY_HEADER} is too long'}, status=400)
+
+        IdempotencyKey.objects.filter(created_at__lt=timezone.now() - IDEMPOTENCY_TTL).delete()
+        try:
+            # Reserve the key before running the view so a concurrent retry can't slip through
+            with transaction.atomic():
+                entry = IdempotencyKey.objects.create(user=request.user, key=key, path=request.path)
+        except IntegrityError:
+            entry = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if entry is not None and entry.path != request.path:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'{IDEMPOTENCY_HEADER} was already used for a different request',
+                }, status=422)
+            if entry is None or entry.status_code is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'A request with this key is still being processed',
+                }, status=409)
+            return _replay(entry)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            entry.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            entry.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=entry.pk).update(
+                status_code=response.status_code,
+                content_type=response.get('Content-Type', ''),
+                response_body=response.content,
+            )
+        return response
+    return wrapper
@@ -0,0 +1,25 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rental.billing import generate_monthly_rent
+
+
+class Command(BaseCommand):
+    help = "Create the month's MonthlyPayment rows for every occupied room in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to bill (YYYY-MM). Defaults to the current month')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Invalid month: {options['month']}. Use YYYY-MM")
+        else:
+            today = date.today()
+            month = date(today.year, today.month, 1)
+
+        created = generate_monthly_rent(month)
+        self.stdout.write(self.style.SUCCESS(f"✓ Created {created} rent rows for {month:%B %Y}"))
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rental.rollups import rebuild_collection_rollups, verify_collection_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the room/building monthly collection rollups from MonthlyPayment and verify them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Only rebuild/check one month (YYYY-MM)')
+        parser.add_argument('--check', action='store_true', help='Only verify the stored rollups, do not rebuild')
+
+    def handle(self, *args, **options):
+        month = None
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError(f"Invalid month: {options['month']}. Use YYYY-MM")
+
+        if not options['check']:
+            rooms, buildings = rebuild_collection_rollups(month)
+            self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt {rooms} room rollups and {buildings} building rollups'))
+
+        problems = verify_collection_rollups(month)
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.WARNING(f'- {problem}'))
+            raise CommandError(f'{len(problems)} rollup mismatches found. Run without --check to rebuild.')
+
+        self.stdout.write(self.style.SUCCESS('✓ Rollups match MonthlyPayment'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from rental.occupancy import reconcile_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Recount active guests per room and fix any drifted Room.occupancy counters.'
+
+    def handle(self, *args, **options):
+        drifted = reconcile_occupancy()
+        for number, stored, actual in drifted:
+            self.stdout.write(self.style.WARNING(f'- Room {number}: occupancy {stored} -> {actual}'))
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(drifted)} rooms corrected'))
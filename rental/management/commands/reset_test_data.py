@@ -8,6 +8,8 @@ from decimal import Decimal
 import random
 
 from rental.models import Guest, Room, MonthlyPayment, PaymentRecord, ElectricityBill
+from rental.rollups import rebuild_collection_rollups
+from rental.occupancy import reconcile_occupancy
 
 
 class Command(BaseCommand):
@@ -138,6 +140,10 @@ class Command(BaseCommand):
             ))
         
         
+        rebuild_collection_rollups()
+        reconcile_occupancy()
+        self.stdout.write(self.style.SUCCESS('  Rebuilt collection rollups and room occupancy'))
+        
         self.stdout.write(self.style.SUCCESS(f'\n✅ Test data created successfully!'))
         self.stdout.write(self.style.SUCCESS(f'  - {len(created_guests)} tenants registered'))
         self.stdout.write(self.style.SUCCESS(f'  - {len(created_guests)} monthly payments created'))
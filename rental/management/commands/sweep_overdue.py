@@ -0,0 +1,40 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rental.overdue import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Mark rent and electricity bills past their due date as overdue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Sweep as of this day (YYYY-MM-DD). Defaults to today')
+        parser.add_argument(
+            '--every', type=int, metavar='SECONDS',
+            help='Keep running and sweep again every SECONDS (in-process scheduler)',
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}. Use YYYY-MM-DD")
+        if options['every'] is not None and options['every'] <= 0:
+            raise CommandError('--every must be a positive number of seconds')
+
+        while True:
+            run = sweep_overdue(today)
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Marked {run.details['rent']} rent rows and {run.details['electricity']} electricity bills "
+                f"overdue in {run.duration_ms}ms"
+            ))
+            if not options['every']:
+                break
+            try:
+                time.sleep(options['every'])
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    MonthlyPayment = apps.get_model('rental', 'MonthlyPayment')
+    RoomMonthlyCollection = apps.get_model('rental', 'RoomMonthlyCollection')
+    BuildingMonthlyCollection = apps.get_model('rental', 'BuildingMonthlyCollection')
+
+    room_rows = []
+    building_rows = {}
+    for p in MonthlyPayment.objects.values('room_id', 'room__number', 'month', 'rent_amount', 'paid_amount', 'payment_status'):
+        number = p['room__number']
+        building = number.split('-')[0] if '-' in number else 'Other'
+        pending = 0 if p['payment_status'] == 'paid' else p['rent_amount'] - p['paid_amount']
+        room_rows.append(RoomMonthlyCollection(
+            room_id=p['room_id'], building=building, month=p['month'],
+            expected_amount=p['rent_amount'], collected_amount=p['paid_amount'],
+            pending_amount=pending, payment_status=p['payment_status'],
+        ))
+        agg = building_rows.setdefault((building, p['month']), BuildingMonthlyCollection(building=building, month=p['month']))
+        agg.rooms_billed += 1
+        agg.expected_amount += p['rent_amount']
+        agg.collected_amount += p['paid_amount']
+        agg.pending_amount += pending
+        count_field = f"{p['payment_status']}_count"
+        if hasattr(agg, count_field):
+            setattr(agg, count_field, getattr(agg, count_field) + 1)
+
+    RoomMonthlyCollection.objects.bulk_create(room_rows, batch_size=500)
+    BuildingMonthlyCollection.objects.bulk_create(building_rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0011_room_capacity_alter_room_is_available'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildingMonthlyCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('building', models.CharField(max_length=20)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('rooms_billed', models.PositiveIntegerField(default=0)),
+                ('expected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('partial_count', models.PositiveIntegerField(default=0)),
+                ('paid_count', models.PositiveIntegerField(default=0)),
+                ('overdue_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-month', 'building'],
+                'unique_together': {('building', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomMonthlyCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('building', models.CharField(db_index=True, max_length=20)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('expected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('payment_status', models.CharField(default='pending', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_collections', to='rental.room')),
+            ],
+            options={
+                'ordering': ['-month', 'room'],
+                'unique_together': {('room', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
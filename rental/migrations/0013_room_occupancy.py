@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:28
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_occupancy(apps, schema_editor):
+    Room = apps.get_model('rental', 'Room')
+    for room in Room.objects.annotate(active=Count('guest', filter=Q(guest__is_active=True))):
+        if room.active:
+            Room.objects.filter(pk=room.pk).update(occupancy=room.active)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0012_monthly_collection_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='occupancy',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Number of active tenants (maintained by rental.occupancy)'),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:33
+
+from django.db import migrations, models
+
+
+def code_for_prefix(prefix):
+    if prefix in ('A', 'M1'):
+        return 'M1'
+    if len(prefix) == 1 and 'B' <= prefix <= 'Z':
+        return str(ord(prefix) - ord('B') + 1)
+    return prefix
+
+
+SUMMED_FIELDS = (
+    'rooms_billed', 'expected_amount', 'collected_amount', 'pending_amount',
+    'pending_count', 'partial_count', 'paid_count', 'overdue_count',
+)
+
+
+def fill_building(apps, schema_editor):
+    Room = apps.get_model('rental', 'Room')
+    RoomMonthlyCollection = apps.get_model('rental', 'RoomMonthlyCollection')
+    BuildingMonthlyCollection = apps.get_model('rental', 'BuildingMonthlyCollection')
+
+    for room in Room.objects.all():
+        code = code_for_prefix(room.number.split('-')[0]) if '-' in room.number else 'Other'
+        Room.objects.filter(pk=room.pk).update(building=code)
+
+    # Rollups were keyed by the raw prefix (A, B, ...); re-key them by building code
+    for prefix in set(RoomMonthlyCollection.objects.values_list('building', flat=True)):
+        RoomMonthlyCollection.objects.filter(building=prefix).update(building=code_for_prefix(prefix))
+
+    # 'A' and 'M1' rows for the same month land on one (building, month) key,
+    # so sum them instead of updating in place
+    merged = {}
+    for row in BuildingMonthlyCollection.objects.all():
+        key = (code_for_prefix(row.building), row.month)
+        totals = merged.setdefault(key, dict.fromkeys(SUMMED_FIELDS, 0))
+        for field in SUMMED_FIELDS:
+            totals[field] += getattr(row, field)
+    BuildingMonthlyCollection.objects.all().delete()
+    BuildingMonthlyCollection.objects.bulk_create([
+        BuildingMonthlyCollection(building=building, month=month, **totals)
+        for (building, month), totals in merged.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0013_room_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='building',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Building code derived from the room number (M1, 1, 2, ...)', max_length=20),
+        ),
+        migrations.RunPython(fill_building, migrations.RunPython.noop),
+    ]
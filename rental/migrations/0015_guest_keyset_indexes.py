@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0014_room_building'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['-created_at', '-id'], name='guest_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['is_active', '-created_at', '-id'], name='guest_active_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0016_sync_support'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(db_index=True, max_length=50)),
+                ('started_at', models.DateTimeField()),
+                ('duration_ms', models.PositiveIntegerField()),
+                ('rows_changed', models.PositiveIntegerField(default=0)),
+                ('details', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
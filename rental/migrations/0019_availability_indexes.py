@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0018_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['is_active', 'check_out', 'check_in'], name='booking_active_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['is_active', 'check_out_date', 'check_in_date'], name='guest_active_window_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental', '0019_availability_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyDirtyRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField(blank=True, null=True)),
+                ('end', models.DateField(blank=True, help_text='Last stale day', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OccupancySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('building', models.CharField(max_length=20)),
+                ('occupied', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day', 'building'],
+                'unique_together': {('day', 'building')},
+            },
+        ),
+    ]
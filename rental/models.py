@@ -1,6 +1,78 @@
 from django.db import models
+from django.db.models import BooleanField, Case, ExpressionWrapper, F, Prefetch, Q, Value, When
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 
+
+def building_code(room_number):
+    """
+    Building code for a room number, matching MaintenanceExpense.building_name.
+
+    The prefix before the dash names the building: A -> M1, B -> 1, C -> 2, ...
+    """
+    if '-' not in room_number:
+        return 'Other'
+    prefix = room_number.split('-')[0]
+    if prefix in ('A', 'M1'):
+        return 'M1'
+    if len(prefix) == 1 and 'B' <= prefix <= 'Z':
+        return str(ord(prefix) - ord('B') + 1)
+    return prefix
+
+
+def building_sort_key(code):
+    """Orders building codes M1, 1, 2, ..., 10, 11, ... and then any other code"""
+    if code == 'M1':
+        return (0, 0, '')
+    if code.isdigit():
+        return (1, int(code), '')
+    return (2, 0, code)
+
+
+def building_label(code):
+    """Display name for a building code"""
+    return 'M1 Complex' if code == 'M1' else f'Building {code}'
+
+
+class RoomQuerySet(models.QuerySet):
+    def with_occupancy(self, tenants=False):
+        """
+        Annotate free_slots, is_bookable and occupancy_status in SQL.
+
+        With tenants=True the active guests are prefetched into
+        room.current_tenants (one extra query for the whole listing).
+        """
+        qs = self.annotate(
+            free_slots=Greatest(F('capacity') - F('occupancy'), Value(0)),
+            is_bookable=ExpressionWrapper(
+                Q(is_available=True) & Q(occupancy__lt=F('capacity')), output_field=BooleanField()
+            ),
+            occupancy_status=Case(
+                When(occupancy=0, then=Value('empty')),
+                When(occupancy__lt=F('capacity'), then=Value('partial')),
+                default=Value('full'),
+            ),
+        )
+        if tenants:
+            qs = qs.prefetch_related(
+                Prefetch('guest_set', queryset=Guest.objects.filter(is_active=True), to_attr='current_tenants')
+            )
+        return qs
+
+    def bookable(self):
+        """Rooms that are marked available and still have a free slot"""
+        return self.with_occupancy().filter(is_bookable=True)
+
+    def building_totals(self):
+        """Per-building room, capacity and occupancy totals in one GROUP BY"""
+        return self.order_by().values('building').annotate(
+            rooms=models.Count('id'),
+            capacity_total=models.Sum('capacity'),
+            occupied=models.Sum('occupancy'),
+            unavailable_rooms=models.Count('id', filter=Q(is_available=False)),
+        ).order_by('building')
+
+
 class Room(models.Model):
     ROOM_TYPES = [
         ('single', 'Single'),
@@ -8,22 +80,45 @@ class Room(models.Model):
         ('suite', 'Suite'),
     ]
     number = models.CharField(max_length=10, unique=True)
+    building = models.CharField(max_length=20, db_index=True, default='', editable=False, help_text="Building code derived from the room number (M1, 1, 2, ...)")
     room_type = models.CharField(max_length=10, choices=ROOM_TYPES)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     agreed_rent = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="Per-room negotiated rent (overrides price when set)")
     capacity = models.PositiveSmallIntegerField(default=1, help_text="Maximum number of tenants allowed in this room")
     is_available = models.BooleanField(default=True, help_text="Manual override for room availability")
+    occupancy = models.PositiveSmallIntegerField(default=0, editable=False, help_text="Number of active tenants (maintained by rental.occupancy)")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
+    objects = RoomQuerySet.as_manager()
+
     class Meta:
         ordering = ['number']
     
     def __str__(self):
         return f"Room {self.number} - {self.get_room_type_display()}"
 
+    def save(self, *args, **kwargs):
+        self.building = building_code(self.number)
+        update_fields = kwargs.get('update_fields')
+        # occupancy is only written by rental.occupancy; never save back a possibly stale copy
+        if not self._state.adding and update_fields is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'occupancy'
+            ]
+        elif update_fields is not None:
+            # Keep updated_at moving for /api/sync/ even on partial saves
+            extra = {'building', 'updated_at'} if 'number' in update_fields else {'updated_at'}
+            kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
+
+    @property
+    def building_label(self):
+        return building_label(self.building)
+
     @property
     def current_occupancy(self):
         """Returns the number of active guests currently in this room"""
-        return self.guest_set.filter(is_active=True).count()
+        return self.occupancy
 
     @property
     def is_full(self):
@@ -59,6 +154,10 @@ class Booking(models.Model):
     
     class Meta:
         ordering = ['-check_in']
+        indexes = [
+            # Date-range overlap lookups (availability.py)
+            models.Index(fields=['is_active', 'check_out', 'check_in'], name='booking_active_window_idx'),
+        ]
     
     def __str__(self):
         return f"Booking: {self.customer_name} - {self.room.number}"
@@ -94,11 +193,18 @@ class Guest(models.Model):
     room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     is_active = models.BooleanField(default=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination for /api/guests/, with and without the active filter
+            models.Index(fields=['-created_at', '-id'], name='guest_created_id_idx'),
+            models.Index(fields=['is_active', '-created_at', '-id'], name='guest_active_created_id_idx'),
+            # Date-range overlap lookups (availability.py)
+            models.Index(fields=['is_active', 'check_out_date', 'check_in_date'], name='guest_active_window_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -126,7 +232,7 @@ class MonthlyPayment(models.Model):
     paid_date = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['-month']
@@ -186,7 +292,7 @@ class ElectricityBill(models.Model):
     paid_date = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         ordering = ['-month']
@@ -226,3 +332,113 @@ class MaintenanceExpense(models.Model):
     
     def __str__(self):
         return f"{self.building_name} - {self.get_category_display()} - ₹{self.amount}"
+
+
+class RoomMonthlyCollection(models.Model):
+    """Pre-summed rent collection per room per month, maintained from MonthlyPayment"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='monthly_collections')
+    building = models.CharField(max_length=20, db_index=True)
+    month = models.DateField(help_text="First day of the month")
+    expected_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    collected_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    pending_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    payment_status = models.CharField(max_length=20, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'room']
+        unique_together = ('room', 'month')
+
+    def __str__(self):
+        return f"{self.room_id} - {self.month.strftime('%B %Y')} - ₹{self.collected_amount}/₹{self.expected_amount}"
+
+
+class BuildingMonthlyCollection(models.Model):
+    """Pre-summed rent collection per building per month, maintained from RoomMonthlyCollection"""
+    building = models.CharField(max_length=20)
+    month = models.DateField(help_text="First day of the month")
+    rooms_billed = models.PositiveIntegerField(default=0)
+    expected_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    collected_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    partial_count = models.PositiveIntegerField(default=0)
+    paid_count = models.PositiveIntegerField(default=0)
+    overdue_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'building']
+        unique_together = ('building', 'month')
+
+    def __str__(self):
+        return f"{self.building} - {self.month.strftime('%B %Y')} - ₹{self.collected_amount}/₹{self.expected_amount}"
+
+
+class SyncTombstone(models.Model):
+    """Records a deleted row so /api/sync/ clients can drop it"""
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class JobRun(models.Model):
+    """One run of a scheduled maintenance job (overdue sweep, snapshots, ...)"""
+    job = models.CharField(max_length=50, db_index=True)
+    started_at = models.DateTimeField()
+    duration_ms = models.PositiveIntegerField()
+    rows_changed = models.PositiveIntegerField(default=0)
+    details = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at:%Y-%m-%d %H:%M} - {self.rows_changed} rows in {self.duration_ms}ms"
+
+
+class OccupancySnapshot(models.Model):
+    """Tenants in one building on one day, kept by the snapshot_occupancy command"""
+    day = models.DateField()
+    building = models.CharField(max_length=20)
+    occupied = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'building']
+        unique_together = ('day', 'building')
+
+    def __str__(self):
+        return f"{self.building} on {self.day:%Y-%m-%d} - {self.occupied}"
+
+
+class OccupancyDirtyRange(models.Model):
+    """Days whose OccupancySnapshot rows are stale; an empty bound is open-ended"""
+    start = models.DateField(null=True, blank=True)
+    end = models.DateField(null=True, blank=True, help_text="Last stale day")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.start or '…'} to {self.end or '…'}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response for a POST sent with an Idempotency-Key header (see rental.idempotency)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Empty while the first request is still running")
+    content_type = models.CharField(max_length=100, blank=True)
+    response_body = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} ({self.path})"
@@ -0,0 +1,84 @@
+"""
+Room Occupancy
+Keeps the denormalized Room.occupancy counter equal to the number of active guests
+"""
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import ROOMS, bump_generation
+from .models import Room, Guest
+
+
+def _active_guest_count():
+    return Coalesce(
+        Subquery(
+            Guest.objects.filter(room=OuterRef('pk'), is_active=True)
+            .order_by()
+            .values('room')
+            .annotate(total=Count('id'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class RoomFullError(ValueError):
+    """The room has no free slot for another tenant"""
+
+
+def assign_room(guest, room_id):
+    """
+    Point `guest` at room `room_id` (None to unassign) without saving it.
+
+    The Room row is locked with select_for_update and its active guests are
+    recounted, so two assignments racing for the last slot run one after the
+    other and the second sees the first. Call inside the transaction.atomic()
+    block that then saves the guest and calls refresh_occupancy(); the lock is
+    held until that commits. The guest does not count against a room it is
+    already in. Returns the locked Room, or None.
+    Raises Room.DoesNotExist or RoomFullError.
+    """
+    if room_id is None:
+        guest.room = None
+        return None
+
+    room = Room.objects.select_for_update().get(pk=room_id)
+    tenants = Guest.objects.filter(room=room, is_active=True)
+    if guest.pk is not None:
+        tenants = tenants.exclude(pk=guest.pk)
+    if tenants.count() >= room.capacity:
+        raise RoomFullError(f'Room {room.number} is already full ({room.capacity}/{room.capacity})')
+    guest.room = room
+    return room
+
+
+def refresh_occupancy(*room_ids):
+    """
+    Recount active guests for the given rooms in a single UPDATE.
+
+    The count runs inside the UPDATE statement, so concurrent writers cannot
+    leave the counter off by one. Call it in the same transaction as the
+    guest change. Room ids that are None are ignored.
+    """
+    room_ids = {room_id for room_id in room_ids if room_id is not None}
+    if room_ids:
+        Room.objects.filter(pk__in=room_ids).update(occupancy=_active_guest_count(), updated_at=timezone.now())
+        bump_generation(ROOMS)
+
+
+def reconcile_occupancy():
+    """Fix every room whose counter drifted from the guest table. Returns the rooms corrected."""
+    drifted = list(
+        Room.objects.annotate(actual=_active_guest_count())
+        .exclude(occupancy=F('actual'))
+        .values_list('number', 'occupancy', 'actual')
+    )
+    if drifted:
+        Room.objects.filter(number__in=[number for number, _, _ in drifted]).update(
+            occupancy=_active_guest_count(), updated_at=timezone.now()
+        )
+        bump_generation(ROOMS)
+    return drifted
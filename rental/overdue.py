@@ -0,0 +1,58 @@
+"""
+Overdue Sweeper
+Marks unpaid rent and electricity bills overdue with one UPDATE per table
+"""
+
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import ELECTRICITY, bump_generation
+from .models import ElectricityBill, JobRun, MonthlyPayment
+from .rollups import rebuild_collection_rollups
+
+# Rent for a month is due by this day of that month
+RENT_DUE_DAY = getattr(settings, 'RENT_DUE_DAY', 10)
+
+
+def rent_overdue_cutoff(today):
+    """Latest billing month whose rent is past due on `today`"""
+    last_grace_day = today - timedelta(days=RENT_DUE_DAY)
+    return date(last_grace_day.year, last_grace_day.month, 1)
+
+
+def sweep_overdue(today=None):
+    """
+    Flip pending/partial rent past its due day and pending electricity bills past
+    due_date to 'overdue'. Records a JobRun and returns it.
+    """
+    today = today or timezone.localdate()
+    started_at = timezone.now()
+    clock = time.perf_counter()
+
+    with transaction.atomic():
+        late_rent = MonthlyPayment.objects.filter(
+            payment_status__in=['pending', 'partial'], month__lte=rent_overdue_cutoff(today)
+        )
+        months = list(late_rent.order_by().values_list('month', flat=True).distinct())
+        rent_rows = late_rent.update(payment_status='overdue', updated_at=started_at)
+        bill_rows = ElectricityBill.objects.filter(bill_status='pending', due_date__lt=today).update(
+            bill_status='overdue', updated_at=started_at
+        )
+
+        # update() skips signals: refresh the rollups and cache generations ourselves
+        if months:
+            rebuild_collection_rollups(months=months)
+        if bill_rows:
+            bump_generation(ELECTRICITY)
+
+        return JobRun.objects.create(
+            job='sweep_overdue',
+            started_at=started_at,
+            duration_ms=int((time.perf_counter() - clock) * 1000),
+            rows_changed=rent_rows + bill_rows,
+            details={'rent': rent_rows, 'electricity': bill_rows, 'as_of': today.isoformat()},
+        )
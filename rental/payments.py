@@ -0,0 +1,151 @@
+"""
+Payment Posting
+Applies rent and electricity payments atomically so concurrent postings never overwrite each other
+"""
+
+import copy
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .cache import ELECTRICITY, PAYMENTS, bump_generation
+from .models import ElectricityBill, MonthlyPayment, PaymentRecord
+from .rollups import refresh_room_collections
+
+
+class PaymentError(ValueError):
+    """A posting was rejected (bad amount, more than the balance, ...)"""
+
+
+def _check_amount(amount, remaining, allow_overpayment):
+    if amount <= 0:
+        raise PaymentError('Payment amount must be greater than 0')
+    if not allow_overpayment and amount > remaining:
+        raise PaymentError(f'Payment amount exceeds remaining balance of ₹{remaining}')
+
+
+def post_rent_payment(monthly_payment_id, amount, payment_date, method='cash', reference='', notes='',
+                      user=None, allow_overpayment=True):
+    """
+    Record `amount` (a Decimal) against a MonthlyPayment.
+
+    The row is locked for the balance check, and paid_amount, payment_status and
+    paid_date are all computed from the stored values in one UPDATE, so two staff
+    members posting at once both count. An overdue month stays overdue until it
+    is settled. Returns (monthly_payment, payment_record).
+    Raises MonthlyPayment.DoesNotExist or PaymentError.
+    """
+    with transaction.atomic():
+        payment = MonthlyPayment.objects.select_for_update().get(pk=monthly_payment_id)
+        _check_amount(amount, payment.remaining_amount(), allow_overpayment)
+
+        record = PaymentRecord.objects.create(
+            monthly_payment=payment,
+            payment_date=payment_date,
+            payment_amount=amount,
+            payment_method=method,
+            reference_number=reference,
+            notes=notes,
+            created_by=user,
+        )
+        # The right-hand sides all see the pre-update row
+        settles = Q(paid_amount__gte=F('rent_amount') - amount)
+        MonthlyPayment.objects.filter(pk=payment.pk).update(
+            paid_amount=F('paid_amount') + amount,
+            payment_status=Case(
+                When(settles, then=Value('paid')),
+                When(payment_status='overdue', then=Value('overdue')),
+                default=Value('partial'),
+            ),
+            paid_date=Case(When(settles, then=Value(payment_date)), default=F('paid_date')),
+            updated_at=timezone.now(),
+        )
+        payment.refresh_from_db()
+        refresh_room_collections(payment.room_id, [payment.month])
+    return payment, record
+
+
+def post_electricity_payment(bill_id, amount, payment_date, allow_overpayment=True):
+    """
+    Record `amount` (a Decimal) against an ElectricityBill with the same locking
+    and single-UPDATE status change as post_rent_payment. Bills only have
+    pending/paid/overdue, so an unsettled bill keeps its status.
+    Returns the refreshed bill. Raises ElectricityBill.DoesNotExist or PaymentError.
+    """
+    with transaction.atomic():
+        bill = ElectricityBill.objects.select_for_update().get(pk=bill_id)
+        _check_amount(amount, bill.remaining_amount(), allow_overpayment)
+
+        settles = Q(paid_amount__gte=F('bill_amount') - amount)
+        ElectricityBill.objects.filter(pk=bill.pk).update(
+            paid_amount=F('paid_amount') + amount,
+            bill_status=Case(When(settles, then=Value('paid')), default=F('bill_status')),
+            paid_date=Case(When(settles, then=Value(payment_date)), default=F('paid_date')),
+            updated_at=timezone.now(),
+        )
+        bill.refresh_from_db()
+        # update() skips signals; rent postings are covered by the PaymentRecord save
+        bump_generation(ELECTRICITY)
+    return bill
+
+
+def post_rent_payments(postings, user=None):
+    """
+    Apply many rent postings in one transaction.
+
+    `postings` is a list of dicts with monthly_payment_id, amount (Decimal),
+    payment_date and optional method/reference/notes, already validated. The
+    affected MonthlyPayment rows are locked in one query, records are inserted
+    with one bulk_create and the parents written back with one bulk_update;
+    several postings may target the same month. Returns one result per posting,
+    in order: the created PaymentRecord, whose monthly_payment shows the month
+    as it stood right after that posting, or None when the MonthlyPayment does
+    not exist.
+    """
+    ids = {p['monthly_payment_id'] for p in postings}
+    with transaction.atomic():
+        parents = MonthlyPayment.objects.select_for_update().in_bulk(ids)
+        records = []
+        results = []
+        for posting in postings:
+            parent = parents.get(posting['monthly_payment_id'])
+            if parent is None:
+                results.append(None)
+                continue
+            # Rows are locked until commit, so the running totals can be kept in Python
+            parent.paid_amount += posting['amount']
+            if parent.paid_amount >= parent.rent_amount:
+                parent.payment_status = 'paid'
+                parent.paid_date = posting['payment_date']
+            elif parent.payment_status != 'overdue':
+                parent.payment_status = 'partial'
+            record = PaymentRecord(
+                # A copy, so later postings to the same month don't change this result
+                monthly_payment=copy.copy(parent),
+                payment_date=posting['payment_date'],
+                payment_amount=posting['amount'],
+                payment_method=posting.get('method', 'cash'),
+                reference_number=posting.get('reference', ''),
+                notes=posting.get('notes', ''),
+                created_by=user,
+            )
+            records.append(record)
+            results.append(record)
+
+        if records:
+            PaymentRecord.objects.bulk_create(records)
+            touched = [parents[pk] for pk in {record.monthly_payment_id for record in records}]
+            now = timezone.now()
+            for parent in touched:
+                parent.updated_at = now
+            MonthlyPayment.objects.bulk_update(touched, ['paid_amount', 'payment_status', 'paid_date', 'updated_at'])
+            # Bulk writes skip signals: refresh each touched room's rollups and bump the cache once
+            months_by_room = defaultdict(set)
+            for parent in touched:
+                months_by_room[parent.room_id].add(parent.month)
+            for room_id, months in months_by_room.items():
+                refresh_room_collections(room_id, months)
+            bump_generation(PAYMENTS)
+    return results
@@ -7,12 +7,19 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
+from django.db import transaction
 from django.db.models import Sum, F, Case, When, DecimalField, Count
 from django.utils import timezone
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 
-from .models import Room, Guest, MonthlyPayment, PaymentRecord, ElectricityBill, MaintenanceExpense
+from .models import Room, Guest, MonthlyPayment, PaymentRecord, ElectricityBill, MaintenanceExpense, OccupancySnapshot, building_label
+from .analytics import room_collection_rows
+from .rollups import refresh_room_collections, month_collection_totals
+from .cache import cached, GUESTS, PAYMENTS, ROOMS
+from .payments import PaymentError, post_electricity_payment, post_rent_payment
+from .idempotency import idempotent
+from .snapshots import SNAPSHOT_DAYS_AHEAD, SNAPSHOT_DAYS_BACK, snapshot_window
 
 def is_admin(user):
     """Check if user is admin"""
@@ -31,80 +38,25 @@ def performance_dashboard(request):
     """
     
     try:
-        # Get all rooms
-        all_rooms = Room.objects.all().order_by('number')
-        total_rooms = all_rooms.count()
-        occupied_rooms = Guest.objects.filter(room__isnull=False, is_active=True).count()
-        
-        # Calculate total collections
-        total_collected = PaymentRecord.objects.aggregate(
-            total=Sum('payment_amount', output_field=DecimalField())
-        )['total'] or Decimal('0.00')
-        
         # Get current month data
         today = date.today()
         current_month = date(today.year, today.month, 1)
-        
-        # Collection analysis by room
-        room_collections = []
-        # Use Decimal accumulators to avoid float rounding errors
-        acc_expected_monthly = Decimal('0.00')
-        acc_collected_this_month = Decimal('0.00')
-        acc_pending_amount = Decimal('0.00')
-        for room in all_rooms:
-            guest = Guest.objects.filter(room=room, is_active=True).first()
-            
-            # Get monthly payment for current month
-            monthly_payment = MonthlyPayment.objects.filter(
-                room=room,
-                month=current_month
-            ).first()
-            
-            if monthly_payment:
-                monthly_rent = monthly_payment.rent_amount
-                collected = monthly_payment.paid_amount
-                pending = monthly_payment.remaining_amount()
-                payment_status = monthly_payment.payment_status
-                monthly_payment_id = monthly_payment.id
-            else:
-                # No payment record, prefer room's agreed_rent if set, otherwise use room.price
-                monthly_rent = room.agreed_rent if getattr(room, 'agreed_rent', None) is not None else room.price
-                collected = Decimal('0.00')
-                pending = monthly_rent
-                payment_status = 'pending'
-                monthly_payment_id = None
-            
-            # Calculate collection percentage
-            if monthly_rent > 0:
-                collection_percentage = int((collected / monthly_rent) * 100)
-            else:
-                collection_percentage = 0
-            
-            # Ensure percentage doesn't exceed 100
-            collection_percentage = min(collection_percentage, 100)
-            
-            # update Decimal accumulators before converting to floats for the template
-            acc_expected_monthly += Decimal(monthly_rent)
-            acc_collected_this_month += Decimal(collected)
-            acc_pending_amount += Decimal(pending)
 
-            room_data = {
-                'room_number': room.number,
-                'room_type': room.get_room_type_display(),
-                'guest_name': f"{guest.first_name} {guest.last_name}" if guest else "Vacant",
-                'monthly_rent': float(monthly_rent),
-                'collected': float(collected),
-                'pending': float(pending),
-                'collection_percentage': collection_percentage,
-                'payment_status': payment_status,
-                'monthly_payment_id': monthly_payment_id,
-            }
-            room_collections.append(room_data)
-        
-        # Calculate summary statistics
-        total_expected_rent = acc_expected_monthly
-        total_collected = acc_collected_this_month
-        total_pending = acc_pending_amount
+        # Collection analysis by room, built with a fixed number of queries
+        room_collections = cached(
+            f'room_collections:{current_month:%Y-%m}', (ROOMS, GUESTS, PAYMENTS),
+            lambda: room_collection_rows(current_month),
+        )
+        total_rooms = len(room_collections)
+        occupied_rooms = sum(rc['occupancy'] for rc in room_collections)
+
+        # Calculate summary statistics from the building rollups, plus the
+        # fallback rent of rooms that have not been billed for the month yet
+        totals = month_collection_totals(current_month)
+        unbilled_rent = sum((rc['monthly_rent'] for rc in room_collections if not rc['monthly_payment_id']), Decimal('0.00'))
+        total_expected_rent = totals['expected'] + unbilled_rent
+        total_collected = totals['collected']
+        total_pending = totals['pending'] + unbilled_rent
         
         # Occupancy rate
         occupancy_rate = (occupied_rooms / total_rooms * 100) if total_rooms > 0 else 0
@@ -113,13 +65,9 @@ def performance_dashboard(request):
         collection_efficiency = (total_collected / total_expected_rent * 100) if total_expected_rent > 0 else 0
         
         # Building occupancy breakdown
-        building_occupancy = {}
-        for room in all_rooms:
-            prefix = room.number.split('-')[0] if '-' in room.number else 'Other'
-            if prefix not in building_occupancy:
-                building_occupancy[prefix] = 0
-            if not room.is_available:
-                building_occupancy[prefix] += 1
+        building_occupancy = cached('building_occupancy', (ROOMS,), lambda: {
+            row['building']: row['unavailable_rooms'] for row in Room.objects.building_totals()
+        })
 
         # Prepare room_data for the detailed table
         room_data = []
@@ -128,10 +76,10 @@ def performance_dashboard(request):
                 'room_number': rc['room_number'],
                 'room_type': rc['room_type'],
                 'active_guest': rc['guest_name'],
-                'price': rc['monthly_rent'],
-                'expected': rc['expected'] if 'expected' in rc else rc['monthly_rent'],
-                'paid': rc['collected'],
-                'balance': rc['pending'],
+                'price': float(rc['monthly_rent']),
+                'expected': float(rc['monthly_rent']),
+                'paid': float(rc['collected']),
+                'balance': float(rc['pending']),
             })
 
         context = {
@@ -192,6 +140,7 @@ def performance_dashboard(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def record_payment_from_dashboard(request):
     """Record payment from performance dashboard"""
     try:
@@ -231,38 +180,17 @@ def record_payment_from_dashboard(request):
                 'message': 'Invalid payment date format'
             }, status=400)
         
-        # Get monthly payment
-        monthly_payment = get_object_or_404(MonthlyPayment, id=monthly_payment_id)
-        
-        # Check if payment amount doesn't exceed remaining
-        if payment_amount > monthly_payment.remaining_amount():
-            return JsonResponse({
-                'success': False,
-                'message': f'Payment amount exceeds remaining balance of ₹{monthly_payment.remaining_amount()}'
-            }, status=400)
-        
-        # Create payment record
-        payment_record = PaymentRecord.objects.create(
-            monthly_payment=monthly_payment,
-            payment_date=payment_date,
-            payment_amount=payment_amount,
-            payment_method=payment_method,
-            reference_number=reference_number,
-            notes=notes,
-            created_by=request.user
-        )
-        
-        # Update monthly payment
-        monthly_payment.paid_amount += payment_amount
-        
-        # Update payment status
-        if monthly_payment.paid_amount >= monthly_payment.rent_amount:
-            monthly_payment.payment_status = 'paid'
-            monthly_payment.paid_date = payment_date
-        elif monthly_payment.paid_amount > 0:
-            monthly_payment.payment_status = 'partial'
-        
-        monthly_payment.save()
+        # Post against the locked row; rejects amounts above the remaining balance
+        try:
+            monthly_payment, payment_record = post_rent_payment(
+                monthly_payment_id, payment_amount, payment_date,
+                method=payment_method, reference=reference_number, notes=notes,
+                user=request.user, allow_overpayment=False,
+            )
+        except MonthlyPayment.DoesNotExist:
+            return JsonResponse({'success': False, 'message': 'Monthly payment not found'}, status=404)
+        except PaymentError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         
         return JsonResponse({
             'success': True,
@@ -281,6 +209,7 @@ def record_payment_from_dashboard(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def record_bill_payment_from_dashboard(request):
     """Record electricity bill payment from performance dashboard"""
     try:
@@ -318,27 +247,13 @@ def record_bill_payment_from_dashboard(request):
                 'message': 'Invalid payment date format'
             }, status=400)
         
-        # Get electricity bill
-        bill = get_object_or_404(ElectricityBill, id=bill_id)
-        
-        # Check if payment doesn't exceed remaining
-        if payment_amount > bill.remaining_amount():
-            return JsonResponse({
-                'success': False,
-                'message': f'Payment amount exceeds remaining balance of ₹{bill.remaining_amount()}'
-            }, status=400)
-        
-        # Update bill payment
-        bill.paid_amount += payment_amount
-        
-        # Update bill status
-        if bill.paid_amount >= bill.bill_amount:
-            bill.bill_status = 'paid'
-            bill.paid_date = payment_date
-        elif bill.paid_amount > 0:
-            bill.bill_status = 'partial'
-        
-        bill.save()
+        # Post against the locked bill; rejects amounts above the remaining balance
+        try:
+            post_electricity_payment(bill_id, payment_amount, payment_date, allow_overpayment=False)
+        except ElectricityBill.DoesNotExist:
+            return JsonResponse({'success': False, 'message': 'Bill not found'}, status=404)
+        except PaymentError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         
         return JsonResponse({
             'success': True,
@@ -357,6 +272,7 @@ def record_bill_payment_from_dashboard(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def record_maintenance(request):
     """Record a maintenance expense from the performance dashboard"""
     try:
@@ -394,3 +310,57 @@ def record_maintenance(request):
     except Exception as e:
         print(f"Error recording maintenance expense: {str(e)}")
         return JsonResponse({'success': False, 'message': f'Error: {str(e)}'}, status=500)
+
+
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def occupancy_calendar(request):
+    """
+    Daily tenants per building from the occupancy snapshots, in columnar form:
+    a `dates` array plus one `occupied` array per building, aligned with it
+    (null for days not snapshotted yet). ?from and ?to (YYYY-MM-DD, inclusive)
+    default to the snapshot window of twelve months either side of today.
+    """
+    window_start, window_end = snapshot_window()
+    try:
+        start = datetime.strptime(request.GET['from'], '%Y-%m-%d').date() if request.GET.get('from') else window_start
+        end = datetime.strptime(request.GET['to'], '%Y-%m-%d').date() if request.GET.get('to') else window_end
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Use YYYY-MM-DD for from/to'}, status=400)
+    max_days = SNAPSHOT_DAYS_BACK + SNAPSHOT_DAYS_AHEAD + 1
+    if end < start or (end - start).days >= max_days:
+        return JsonResponse({
+            'success': False,
+            'message': f'to must be on or after from, and at most {max_days} days later'
+        }, status=400)
+
+    days = (end - start).days + 1
+    snapshotted = set()
+    series = {}
+    for day, building, occupied in OccupancySnapshot.objects.filter(day__range=(start, end)).values_list(
+        'day', 'building', 'occupied'
+    ):
+        offset = (day - start).days
+        snapshotted.add(offset)
+        series.setdefault(building, [None] * days)[offset] = occupied
+
+    capacities = {row['building']: row['capacity_total'] for row in Room.objects.building_totals()}
+    buildings = []
+    for code in sorted(series.keys() | capacities.keys()):
+        occupied = series.get(code, [None] * days)
+        for offset in snapshotted:
+            if occupied[offset] is None:
+                occupied[offset] = 0
+        buildings.append({
+            'code': code,
+            'label': building_label(code),
+            'capacity': capacities.get(code, 0),
+            'occupied': occupied,
+        })
+
+    return JsonResponse({
+        'success': True,
+        'dates': [(start + timedelta(days=offset)).isoformat() for offset in range(days)],
+        'buildings': buildings,
+    })
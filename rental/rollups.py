@@ -0,0 +1,190 @@
+"""
+Collection Rollups
+Keeps RoomMonthlyCollection and BuildingMonthlyCollection in step with MonthlyPayment
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .cache import PAYMENTS, bump_generation
+from .models import MonthlyPayment, RoomMonthlyCollection, BuildingMonthlyCollection
+
+STATUS_COUNT_FIELDS = {
+    'pending': 'pending_count',
+    'partial': 'partial_count',
+    'paid': 'paid_count',
+    'overdue': 'overdue_count',
+}
+
+
+def _pending_for(rent_amount, paid_amount, status):
+    return Decimal('0.00') if status == 'paid' else rent_amount - paid_amount
+
+
+def _room_rows(payments):
+    """Build unsaved RoomMonthlyCollection rows from MonthlyPayment values"""
+    return [
+        RoomMonthlyCollection(
+            room_id=p['room_id'],
+            building=p['room__building'],
+            month=p['month'],
+            expected_amount=p['rent_amount'],
+            collected_amount=p['paid_amount'],
+            pending_amount=_pending_for(p['rent_amount'], p['paid_amount'], p['payment_status']),
+            payment_status=p['payment_status'],
+        )
+        for p in payments
+    ]
+
+
+def _payment_values(queryset):
+    return queryset.values('room_id', 'room__building', 'month', 'rent_amount', 'paid_amount', 'payment_status')
+
+
+def refresh_building_collections(keys):
+    """Recompute BuildingMonthlyCollection rows for the given (building, month) pairs"""
+    keys = set(keys)
+    if not keys:
+        return
+    buildings = {b for b, _ in keys}
+    months = {m for _, m in keys}
+    sums = RoomMonthlyCollection.objects.filter(building__in=buildings, month__in=months).values(
+        'building', 'month'
+    ).annotate(
+        rooms_billed=Count('id'),
+        expected_amount=Sum('expected_amount'),
+        collected_amount=Sum('collected_amount'),
+        pending_amount=Sum('pending_amount'),
+        **{field: Count('id', filter=Q(payment_status=status)) for status, field in STATUS_COUNT_FIELDS.items()}
+    )
+    # The sums cover every building x month pair asked about, so replace that
+    # whole block in two statements however many keys there are
+    BuildingMonthlyCollection.objects.filter(building__in=buildings, month__in=months).delete()
+    BuildingMonthlyCollection.objects.bulk_create([BuildingMonthlyCollection(**row) for row in sums])
+
+
+def refresh_room_collections(room_id, months=None):
+    """
+    Recompute the rollups touched by one room.
+
+    Pass the months whose MonthlyPayment changed, or None to refresh every month
+    on file for the room (e.g. after its number, and so its building, changed).
+    Call inside the same transaction as the money change.
+    """
+    existing = RoomMonthlyCollection.objects.filter(room_id=room_id)
+    payments = MonthlyPayment.objects.filter(room_id=room_id)
+    if months is not None:
+        months = set(months)
+        existing = existing.filter(month__in=months)
+        payments = payments.filter(month__in=months)
+
+    touched = set(existing.values_list('building', 'month'))
+    existing.delete()
+    rows = RoomMonthlyCollection.objects.bulk_create(_room_rows(_payment_values(payments)))
+    touched.update((row.building, row.month) for row in rows)
+    refresh_building_collections(touched)
+
+
+def _month_filter(month=None, months=None):
+    if month is not None:
+        return {'month': month}
+    if months is not None:
+        return {'month__in': set(months)}
+    return {}
+
+
+def _expected_rollups(month=None, months=None):
+    """Compute room and building rollups from the source rows without saving them"""
+    payments = MonthlyPayment.objects.filter(**_month_filter(month, months))
+    room_rows = _room_rows(_payment_values(payments))
+
+    building_rows = {}
+    for row in room_rows:
+        key = (row.building, row.month)
+        agg = building_rows.get(key)
+        if agg is None:
+            agg = building_rows[key] = BuildingMonthlyCollection(building=row.building, month=row.month)
+        agg.rooms_billed += 1
+        agg.expected_amount += row.expected_amount
+        agg.collected_amount += row.collected_amount
+        agg.pending_amount += row.pending_amount
+        field = STATUS_COUNT_FIELDS.get(row.payment_status)
+        if field:
+            setattr(agg, field, getattr(agg, field) + 1)
+    return room_rows, list(building_rows.values())
+
+
+def rebuild_collection_rollups(month=None, months=None):
+    """Rebuild all rollups (or one month's, or a set of months') in bulk. Returns (room rows, building rows) written."""
+    months_filter = _month_filter(month, months)
+    room_rows, building_rows = _expected_rollups(month, months)
+    with transaction.atomic():
+        RoomMonthlyCollection.objects.filter(**months_filter).delete()
+        BuildingMonthlyCollection.objects.filter(**months_filter).delete()
+        RoomMonthlyCollection.objects.bulk_create(room_rows, batch_size=500)
+        BuildingMonthlyCollection.objects.bulk_create(building_rows, batch_size=500)
+        bump_generation(PAYMENTS)
+    return len(room_rows), len(building_rows)
+
+
+def verify_collection_rollups(month=None):
+    """Compare stored rollups with the source rows. Returns a list of mismatch descriptions."""
+    room_fields = ('building', 'expected_amount', 'collected_amount', 'pending_amount', 'payment_status')
+    building_fields = ('rooms_billed', 'expected_amount', 'collected_amount', 'pending_amount') + tuple(
+        STATUS_COUNT_FIELDS.values()
+    )
+    room_rows, building_rows = _expected_rollups(month)
+
+    stored_rooms = RoomMonthlyCollection.objects.all()
+    stored_buildings = BuildingMonthlyCollection.objects.all()
+    if month is not None:
+        stored_rooms = stored_rooms.filter(month=month)
+        stored_buildings = stored_buildings.filter(month=month)
+
+    problems = []
+    problems += _diff(
+        {(r.room_id, r.month): r for r in room_rows},
+        {(r.room_id, r.month): r for r in stored_rooms},
+        room_fields, 'room',
+    )
+    problems += _diff(
+        {(b.building, b.month): b for b in building_rows},
+        {(b.building, b.month): b for b in stored_buildings},
+        building_fields, 'building',
+    )
+    return problems
+
+
+def _diff(expected, stored, fields, label):
+    problems = []
+    for key in expected.keys() - stored.keys():
+        problems.append(f'missing {label} rollup {key}')
+    for key in stored.keys() - expected.keys():
+        problems.append(f'stale {label} rollup {key}')
+    for key in expected.keys() & stored.keys():
+        for field in fields:
+            want, have = getattr(expected[key], field), getattr(stored[key], field)
+            if want != have:
+                problems.append(f'{label} rollup {key} {field}: expected {want}, stored {have}')
+    return problems
+
+
+def month_collection_totals(month):
+    """Expected/collected/pending totals for a month, read from the building rollups"""
+    totals = BuildingMonthlyCollection.objects.filter(month=month).aggregate(
+        expected=Sum('expected_amount'),
+        collected=Sum('collected_amount'),
+        pending=Sum('pending_amount'),
+    )
+    return {key: value or Decimal('0.00') for key, value in totals.items()}
+
+
+def payment_status_totals():
+    """Status counts and total pending amount across all months, read from the building rollups"""
+    totals = BuildingMonthlyCollection.objects.aggregate(
+        total_pending_amount=Sum('pending_amount'),
+        **{status: Sum(field) for status, field in STATUS_COUNT_FIELDS.items()}
+    )
+    return {key: value or 0 for key, value in totals.items()}
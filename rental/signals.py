@@ -0,0 +1,112 @@
+"""
+Model Signals
+Bump cache generations whenever a model that feeds a cached aggregate changes,
+leave tombstones for rows that /api/sync/ clients need to drop, keep updated_at
+moving on rows changed by bulk updates Django runs itself, and flag the
+occupancy snapshot days a stay change touches
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from .cache import BOOKINGS, ELECTRICITY, GUESTS, PAYMENTS, ROOMS, bump_generation
+from .models import Booking, ElectricityBill, Guest, MonthlyPayment, PaymentRecord, Room
+from .snapshots import mark_all_dirty, mark_stay_dirty
+from .sync import SYNC_SOURCES, prune_tombstones, record_tombstone
+
+MODEL_NAMESPACES = {
+    Room: (ROOMS,),
+    # Room listings show tenant names and occupancy
+    Guest: (GUESTS, ROOMS),
+    Booking: (BOOKINGS,),
+    MonthlyPayment: (PAYMENTS,),
+    PaymentRecord: (PAYMENTS,),
+    ElectricityBill: (ELECTRICITY,),
+}
+
+
+def invalidate_cached_aggregates(sender, **kwargs):
+    bump_generation(*MODEL_NAMESPACES[sender])
+
+
+def leave_tombstone(sender, instance, **kwargs):
+    record_tombstone(instance)
+    # Deletes are rare, so this is a cheap place to expire old tombstones
+    prune_tombstones()
+
+
+# Fields that decide whether and when a row occupies a room slot
+STAY_FIELDS = {
+    Guest: ('room_id', 'is_active', 'check_in_date', 'check_out_date'),
+    Booking: ('room_id', 'is_active', 'check_in', 'check_out'),
+}
+
+
+def _stay(sender, instance):
+    return tuple(getattr(instance, field) for field in STAY_FIELDS[sender])
+
+
+def remember_stored_stay(sender, instance, **kwargs):
+    # Read the row as stored so a moved or shortened stay also frees its old days
+    instance._stored_stay = None
+    if instance.pk is not None:
+        instance._stored_stay = sender.objects.filter(pk=instance.pk).values_list(*STAY_FIELDS[sender]).first()
+
+
+def dirty_saved_stay(sender, instance, **kwargs):
+    stay = _stay(sender, instance)
+    stored = getattr(instance, '_stored_stay', None)
+    if stored == stay:
+        return
+    for room_id, is_active, check_in, check_out in {stored, stay} - {None}:
+        if room_id is not None and is_active:
+            mark_stay_dirty(check_in, check_out)
+
+
+def dirty_deleted_stay(sender, instance, **kwargs):
+    room_id, is_active, check_in, check_out = _stay(sender, instance)
+    if room_id is not None and is_active:
+        mark_stay_dirty(check_in, check_out)
+
+
+def remember_stored_building(sender, instance, update_fields=None, **kwargs):
+    instance._stored_building = None
+    if instance.pk is not None and (update_fields is None or 'number' in update_fields):
+        instance._stored_building = Room.objects.filter(pk=instance.pk).values_list('building', flat=True).first()
+
+
+def dirty_renumbered_room(sender, instance, created=False, **kwargs):
+    # A new building code moves every stay in the room to another building
+    stored = getattr(instance, '_stored_building', None)
+    if not created and stored is not None and stored != instance.building:
+        mark_all_dirty()
+
+
+def touch_unassigned_guests(sender, instance, **kwargs):
+    # The SET_NULL that follows is a bulk UPDATE that leaves updated_at alone, so
+    # move it here, in the same transaction, for /api/sync/ clients to see the change
+    if Guest.objects.filter(room=instance).update(updated_at=timezone.now()):
+        bump_generation(GUESTS)
+
+
+def dirty_deleted_room(sender, instance, **kwargs):
+    # Guests are unassigned by a bulk UPDATE that sends no signals
+    mark_all_dirty()
+
+
+for model in MODEL_NAMESPACES:
+    post_save.connect(invalidate_cached_aggregates, sender=model, dispatch_uid=f'cache_post_save_{model.__name__}')
+    post_delete.connect(invalidate_cached_aggregates, sender=model, dispatch_uid=f'cache_post_delete_{model.__name__}')
+
+for model, _ in SYNC_SOURCES.values():
+    post_delete.connect(leave_tombstone, sender=model, dispatch_uid=f'sync_tombstone_{model.__name__}')
+
+for model in STAY_FIELDS:
+    pre_save.connect(remember_stored_stay, sender=model, dispatch_uid=f'snapshot_pre_save_{model.__name__}')
+    post_save.connect(dirty_saved_stay, sender=model, dispatch_uid=f'snapshot_post_save_{model.__name__}')
+    post_delete.connect(dirty_deleted_stay, sender=model, dispatch_uid=f'snapshot_post_delete_{model.__name__}')
+
+pre_save.connect(remember_stored_building, sender=Room, dispatch_uid='snapshot_pre_save_Room')
+post_save.connect(dirty_renumbered_room, sender=Room, dispatch_uid='snapshot_post_save_Room')
+post_delete.connect(dirty_deleted_room, sender=Room, dispatch_uid='snapshot_post_delete_Room')
+pre_delete.connect(touch_unassigned_guests, sender=Room, dispatch_uid='sync_pre_delete_Room')
@@ -0,0 +1,107 @@
+"""
+Occupancy Snapshots
+Tenants per building per day, recomputed only for the days a change touched
+
+Guest, Booking and Room signals (see signals.py) record the days a change
+affects as OccupancyDirtyRange rows. refresh_snapshots() rewrites those days,
+plus any day of the rolling window that has no snapshot yet.
+"""
+
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import stay_offsets, stays_overlapping
+from .models import JobRun, OccupancyDirtyRange, OccupancySnapshot, Room
+
+# Days kept either side of today
+SNAPSHOT_DAYS_BACK = 365
+SNAPSHOT_DAYS_AHEAD = 365
+
+
+def snapshot_window(today=None):
+    """First and last day (inclusive) snapshotted around `today`"""
+    today = today or timezone.localdate()
+    return today - timedelta(days=SNAPSHOT_DAYS_BACK), today + timedelta(days=SNAPSHOT_DAYS_AHEAD)
+
+
+def mark_stay_dirty(check_in, check_out):
+    """Flag the days a stay occupies (check_in up to the day before check_out; None is open-ended)"""
+    last = check_out - timedelta(days=1) if check_out is not None else None
+    OccupancyDirtyRange.objects.create(start=check_in, end=last)
+
+
+def mark_all_dirty():
+    OccupancyDirtyRange.objects.create(start=None, end=None)
+
+
+def occupied_by_building(start, end):
+    """{building: tenants on each day from start to end (inclusive)}, from two stay queries"""
+    days = (end - start).days + 1
+    room_buildings = dict(Room.objects.values_list('id', 'building'))
+    edges = {building: [0] * (days + 1) for building in set(room_buildings.values())}
+    for room_id, check_in, check_out in stays_overlapping(Room.objects.all(), start, end + timedelta(days=1)):
+        first, last = stay_offsets(check_in, check_out, start, days)
+        if first < last:
+            series = edges[room_buildings[room_id]]
+            series[first] += 1
+            series[last] -= 1
+    return {building: list(accumulate(series[:days])) for building, series in edges.items()}
+
+
+def _days(start, end):
+    return {start + timedelta(days=offset) for offset in range((end - start).days + 1)}
+
+
+def refresh_snapshots(today=None, full=False):
+    """
+    Bring OccupancySnapshot up to date for the window around `today`.
+
+    Only the days named by pending dirty ranges, and days of the window with no
+    snapshot yet (the whole window on the first run, one new day per day after
+    that), are recomputed; `full` recomputes the whole window. Ranges recorded
+    while this runs are left for the next run. Records and returns a JobRun.
+    """
+    started_at = timezone.now()
+    clock = time.perf_counter()
+    window_start, window_end = snapshot_window(today)
+
+    with transaction.atomic():
+        pending = list(OccupancyDirtyRange.objects.values_list('id', 'start', 'end'))
+        if full:
+            days = _days(window_start, window_end)
+        else:
+            snapshotted = set(
+                OccupancySnapshot.objects.filter(day__range=(window_start, window_end))
+                .order_by().values_list('day', flat=True).distinct()
+            )
+            days = _days(window_start, window_end) - snapshotted
+            for _, start, end in pending:
+                start = max(start or window_start, window_start)
+                end = min(end or window_end, window_end)
+                if start <= end:
+                    days |= _days(start, end)
+
+        rows = []
+        if days:
+            first = min(days)
+            counts = occupied_by_building(first, max(days))
+            rows = [
+                OccupancySnapshot(day=day, building=building, occupied=series[(day - first).days])
+                for day in sorted(days)
+                for building, series in counts.items()
+            ]
+            OccupancySnapshot.objects.filter(day__in=days).delete()
+            OccupancySnapshot.objects.bulk_create(rows, batch_size=1000)
+        OccupancyDirtyRange.objects.filter(pk__in=[pk for pk, _, _ in pending]).delete()
+
+        return JobRun.objects.create(
+            job='snapshot_occupancy',
+            started_at=started_at,
+            duration_ms=int((time.perf_counter() - clock) * 1000),
+            rows_changed=len(rows),
+            details={'days': len(days), 'dirty_ranges': len(pending), 'full': full},
+        )
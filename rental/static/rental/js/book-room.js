@@ -1,6 +1,7 @@
 /**
  * Book Room Page - Event Handlers
  * Fixes CSP violations by moving all inline event handlers to external file
+ * Load after utils.js (idempotentPost, conditionalGetJSON)
  */
 
 document.addEventListener('DOMContentLoaded', function() {
@@ -35,13 +36,8 @@ function updateRoomDetails(event) {
   const roomId = event.target.value;
   if (!roomId) return;
 
-  fetch(`/api/room/${roomId}/details/`, {
-    method: 'GET',
-    headers: {
-      'Content-Type': 'application/json',
-    }
-  })
-  .then(response => response.json())
+  // Revalidates with the last ETag, so switching back to a room is a 304 (utils.js)
+  conditionalGetJSON(`/api/room/${roomId}/details/`)
   .then(data => {
     if (data.success) {
       // Update room price and details
@@ -97,8 +93,7 @@ function handleBookingSubmit(event) {
   submitBtn.textContent = 'Processing...';
   
   // Submit form
-  fetch(form.action || '/booking/', {
-    method: 'POST',
+  idempotentPost(form.action || '/booking/', {
     headers: {
       'X-CSRFToken': csrfToken,
     },
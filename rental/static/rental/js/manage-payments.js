@@ -1,6 +1,7 @@
 /**
  * Manage Payments Page - Event Handlers
  * Fixes CSP violations by moving all inline event handlers to external file
+ * Load after utils.js (idempotentPost)
  */
 
 document.addEventListener('DOMContentLoaded', function() {
@@ -82,8 +83,7 @@ function handlePaymentSubmit(event) {
   const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
   
   // Send form data via fetch
-  fetch('/api/payment/record/', {
-    method: 'POST',
+  idempotentPost('/api/payment/record/', {
     headers: {
       'X-CSRFToken': csrfToken,
     },
@@ -108,6 +108,57 @@ function throttle(func, limit) {
   };
 }
 
+/**
+ * POST with an Idempotency-Key header so a retry can't create duplicates.
+ * The same key is reused when the network drops, so the server either runs
+ * the request once or replays the stored response.
+ */
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+async function idempotentPost(url, options = {}, retries = 2) {
+  const headers = new Headers(options.headers || {});
+  if (!headers.has('Idempotency-Key')) headers.set('Idempotency-Key', newIdempotencyKey());
+  const request = { ...options, method: 'POST', headers };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, request);
+      // 409: the first attempt is still running on the server
+      if (response.status !== 409 || attempt >= retries) return response;
+    } catch (err) {
+      if (attempt >= retries) throw err;
+    }
+    await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+  }
+}
+
+/**
+ * GET JSON, revalidating with the ETag of the previous response for the same
+ * URL. An unchanged resource comes back as an empty 304 and the body kept
+ * from last time is returned, so polling and reopened modals cost one round trip.
+ */
+const etagCache = new Map();
+
+async function conditionalGetJSON(url, options = {}) {
+  const headers = new Headers(options.headers || {});
+  const cached = etagCache.get(url);
+  if (cached) headers.set('If-None-Match', cached.etag);
+  // Bypass the HTTP cache so the 304 reaches us instead of being answered from it
+  const response = await fetch(url, { ...options, method: 'GET', headers, cache: 'no-store' });
+  if (response.status === 304 && cached) return cached.data;
+
+  const data = await response.json();
+  const etag = response.headers.get('ETag');
+  if (response.ok && etag) {
+    etagCache.set(url, { etag, data });
+  } else {
+    etagCache.delete(url);
+  }
+  return data;
+}
+
 /**
  * Prefetch DNS for external resources
  */
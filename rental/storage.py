@@ -1,4 +1,6 @@
-from whitenoise.storage import CompressedStaticFilesStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
 
-class MyStorage(CompressedStaticFilesStorage):
-    pass
+class MyStorage(CompressedManifestStaticFilesStorage):
+    # Fingerprinted names let WhiteNoise serve files as immutable; a missing
+    # manifest entry falls back to the plain name instead of raising
+    manifest_strict = False
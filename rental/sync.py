@@ -0,0 +1,85 @@
+"""
+Delta Sync
+Rows changed since a sync token, plus tombstones for deleted rows
+
+A token is the server time the previous sync started, in microseconds. Each
+call reads rows with updated_at at or after that time (less a small overlap for
+transactions that committed late), so clients must upsert by id.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import ElectricityBill, Guest, MonthlyPayment, Room, SyncTombstone
+
+SYNC_OVERLAP = timedelta(seconds=5)
+# Tombstones older than this are pruned; older tokens get a full reload
+SYNC_TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Sync kind -> (model, fields sent for a changed row)
+SYNC_SOURCES = {
+    'rooms': (Room, (
+        'id', 'number', 'building', 'room_type', 'price', 'agreed_rent', 'capacity', 'occupancy', 'is_available',
+    )),
+    'guests': (Guest, (
+        'id', 'first_name', 'last_name', 'email', 'phone', 'room_id', 'check_in_date', 'check_out_date', 'is_active',
+    )),
+    'payments': (MonthlyPayment, (
+        'id', 'room_id', 'guest_id', 'month', 'rent_amount', 'paid_amount', 'payment_status', 'paid_date',
+    )),
+    'electricity_bills': (ElectricityBill, (
+        'id', 'room_id', 'guest_id', 'month', 'units_consumed', 'bill_amount', 'paid_amount', 'bill_status',
+        'due_date', 'paid_date',
+    )),
+}
+TOMBSTONE_KINDS = {model.__name__: kind for kind, (model, _) in SYNC_SOURCES.items()}
+
+
+def encode_token(moment):
+    delta = moment - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    return str((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def decode_token(token):
+    """Raises ValueError for anything that isn't a token issued by encode_token()"""
+    micros = int(token)
+    if micros < 0:
+        raise ValueError('negative sync token')
+    return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micros)
+
+
+def record_tombstone(instance):
+    SyncTombstone.objects.create(model=type(instance).__name__, object_id=instance.pk)
+
+
+def prune_tombstones():
+    return SyncTombstone.objects.filter(deleted_at__lt=timezone.now() - SYNC_TOMBSTONE_RETENTION).delete()[0]
+
+
+def changes_since(since):
+    """
+    Everything that changed at or after `since` (None for a fresh session).
+
+    Returns a dict with the new token, one list of changed rows per kind and a
+    `deleted` map of kind -> ids. When `since` is None or older than the
+    tombstone retention, `reset` is True and no rows are sent: the client should
+    reload and start syncing from the returned token.
+    """
+    now = timezone.now()
+    if since is None or since < now - SYNC_TOMBSTONE_RETENTION:
+        payload = {'token': encode_token(now), 'reset': True, 'deleted': {kind: [] for kind in SYNC_SOURCES}}
+        payload.update((kind, []) for kind in SYNC_SOURCES)
+        return payload
+
+    payload = {'token': encode_token(now), 'reset': False}
+    start = since - SYNC_OVERLAP
+    for kind, (model, fields) in SYNC_SOURCES.items():
+        payload[kind] = list(model.objects.filter(updated_at__gte=start).order_by('updated_at', 'id').values(*fields))
+
+    deleted = {kind: [] for kind in SYNC_SOURCES}
+    tombstones = SyncTombstone.objects.filter(deleted_at__gte=start, model__in=TOMBSTONE_KINDS)
+    for model_name, object_id in tombstones.values_list('model', 'object_id'):
+        deleted[TOMBSTONE_KINDS[model_name]].append(object_id)
+    payload['deleted'] = deleted
+    return payload
@@ -1,9 +1,38 @@
-from django.test import TestCase, override_settings
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.http import HttpResponse
+from hotel_project.middleware import CompressionMiddleware, LoginRequiredMiddleware, SecurityHeadersMiddleware, compression_stats
+from hotel_project.cache_policy import NO_STORE, PRIVATE, PUBLIC_PAGE, policy_for
 from django.conf import settings
-from .models import Room, ElectricityBill, Guest
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from .models import Room, Booking, ElectricityBill, Guest, MonthlyPayment, PaymentRecord, BuildingMonthlyCollection, JobRun, IdempotencyKey, OccupancyDirtyRange, OccupancySnapshot
+from .analytics import room_collection_rows
+from .rollups import rebuild_collection_rollups, verify_collection_rollups, month_collection_totals
+from .occupancy import RoomFullError, assign_room, reconcile_occupancy, refresh_occupancy
+from .availability import free_slots
+from .snapshots import refresh_snapshots
+from .billing import bill_stay, generate_monthly_rent, month_range
+from .overdue import sweep_overdue
+from .payments import PaymentError, post_electricity_payment, post_rent_payment
+from .cache import cached, generations, ROOMS, PAYMENTS
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from datetime import date, datetime, timedelta
+from django.utils import timezone
+from decimal import Decimal
+from io import StringIO
+import importlib
+import tempfile
+import threading
+import time
+import asyncio
+from asgiref.sync import iscoroutinefunction
+from unittest import mock, skipUnless
+from types import SimpleNamespace
+import gzip
+from django.core.management import call_command
 import json
 
 
@@ -257,3 +286,1381 @@ class GuestFileUploadTests(TestCase):
         guest.refresh_from_db()
         self.assertEqual(guest.first_name, 'Updated')
         self.assertTrue(guest.govt_id_photo)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class PerformanceDashboardQueryTests(TestCase):
+    """The collection table must not issue queries per room"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        today = date.today()
+        self.month = date(today.year, today.month, 1)
+
+    def add_rooms(self, start, count):
+        for i in range(start, start + count):
+            room = Room.objects.create(number=f'B-{i}', room_type='single', price=7000, agreed_rent=6500)
+            Guest.objects.create(first_name='Guest', last_name=str(i), room=room)
+            if i % 2:
+                MonthlyPayment.objects.create(room=room, month=self.month, rent_amount=6500, paid_amount=2000,
+                                              payment_status='partial')
+
+    def count_dashboard_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('performance_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_constant_as_rooms_grow(self):
+        self.add_rooms(100, 3)
+        rebuild_collection_rollups()
+        small = self.count_dashboard_queries()
+        self.add_rooms(200, 12)
+        rebuild_collection_rollups()
+        large = self.count_dashboard_queries()
+        self.assertEqual(small, large)
+
+    def test_collection_rows_single_query(self):
+        self.add_rooms(100, 2)
+        with self.assertNumQueries(1):
+            rows = room_collection_rows(self.month)
+        billed, unbilled = rows[1], rows[0]
+        self.assertEqual(billed['guest_name'], 'Guest 101')
+        self.assertEqual(billed['pending'], Decimal('4500'))
+        self.assertEqual(billed['payment_status'], 'partial')
+        self.assertIsNone(unbilled['monthly_payment_id'])
+        self.assertEqual(unbilled['monthly_rent'], Decimal('6500'))
+        self.assertEqual(unbilled['pending'], Decimal('6500'))
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class CollectionRollupTests(TestCase):
+    """Rollups follow every money change and match a bulk rebuild"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='C-101', room_type='single', price=7000)
+        self.other = Room.objects.create(number='C-102', room_type='single', price=5000)
+
+    def create_month(self, room, month='2025-11'):
+        response = self.client.post(reverse('create_monthly_payment'), {'room_id': room.id, 'month': month})
+        self.assertTrue(json.loads(response.content)['success'])
+        return MonthlyPayment.objects.get(room=room, month=datetime.strptime(month, '%Y-%m').date())
+
+    def test_rollups_follow_payments(self):
+        payment = self.create_month(self.room)
+        self.create_month(self.other)
+        response = self.client.post(reverse('record_payment_dashboard'), {
+            'monthly_payment_id': payment.id,
+            'payment_amount': '3000',
+            'payment_date': '2025-11-05',
+        })
+        self.assertTrue(json.loads(response.content)['success'])
+
+        building = BuildingMonthlyCollection.objects.get(building='2', month=date(2025, 11, 1))
+        self.assertEqual(building.rooms_billed, 2)
+        self.assertEqual(building.expected_amount, Decimal('12000'))
+        self.assertEqual(building.collected_amount, Decimal('3000'))
+        self.assertEqual(building.pending_amount, Decimal('9000'))
+        self.assertEqual((building.partial_count, building.pending_count), (1, 1))
+
+        record = PaymentRecord.objects.get(monthly_payment=payment)
+        self.client.post(reverse('update_payment_record', args=[record.id]), {'payment_amount': '7000'})
+        totals = month_collection_totals(date(2025, 11, 1))
+        self.assertEqual(totals['collected'], Decimal('7000'))
+        self.assertEqual(totals['pending'], Decimal('5000'))
+
+        self.client.post(reverse('delete_payment_record', args=[record.id]))
+        self.assertEqual(month_collection_totals(date(2025, 11, 1))['collected'], Decimal('0'))
+        self.assertEqual(verify_collection_rollups(), [])
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        self.create_month(self.room)
+        self.create_month(self.room, '2025-12')
+        MonthlyPayment.objects.filter(room=self.room).update(paid_amount=1000, payment_status='partial')
+        self.assertNotEqual(verify_collection_rollups(), [])
+        self.assertEqual(rebuild_collection_rollups(), (2, 2))
+        self.assertEqual(verify_collection_rollups(), [])
+
+    def test_deleting_room_updates_building_rollup(self):
+        self.create_month(self.room)
+        self.create_month(self.other)
+        self.client.post(reverse('delete_room', args=[self.other.id]))
+        building = BuildingMonthlyCollection.objects.get(building='2', month=date(2025, 11, 1))
+        self.assertEqual(building.rooms_billed, 1)
+        self.assertEqual(verify_collection_rollups(), [])
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class RoomOccupancyTests(TestCase):
+    """Room.occupancy follows guest changes and room pages render without per-room queries"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='D-101', room_type='double', price=7000, capacity=2)
+        self.other = Room.objects.create(number='D-102', room_type='single', price=7000, capacity=1)
+
+    def add_guest(self, room, name='Tenant'):
+        response = self.client.post(reverse('add_guest'), {'first_name': name, 'last_name': 'Test', 'room_id': room.id})
+        self.assertTrue(json.loads(response.content)['success'])
+        return Guest.objects.latest('id')
+
+    def occupancy(self, room):
+        room.refresh_from_db()
+        return room.occupancy
+
+    def test_counter_follows_guest_lifecycle(self):
+        first = self.add_guest(self.room)
+        second = self.add_guest(self.room, 'Second')
+        self.assertEqual(self.occupancy(self.room), 2)
+        self.assertTrue(self.room.is_full)
+
+        response = self.client.post(reverse('update_guest', args=[second.id]), {
+            'first_name': 'Second', 'last_name': 'Test', 'room_id': self.other.id,
+        })
+        self.assertTrue(json.loads(response.content)['success'])
+        self.assertEqual((self.occupancy(self.room), self.occupancy(self.other)), (1, 1))
+
+        self.client.post(reverse('checkout_guest', args=[first.id]))
+        self.client.post(reverse('delete_guest', args=[second.id]))
+        self.assertEqual((self.occupancy(self.room), self.occupancy(self.other)), (0, 0))
+
+    def test_room_save_does_not_overwrite_counter(self):
+        stale = Room.objects.get(pk=self.room.pk)
+        self.add_guest(self.room)
+        stale.is_available = False
+        stale.save()
+        self.assertEqual(self.occupancy(self.room), 1)
+
+    def test_reconcile_fixes_drift(self):
+        Guest.objects.create(first_name='Direct', last_name='Insert', room=self.other)
+        self.assertEqual([(n, s, a) for n, s, a in reconcile_occupancy()], [('D-102', 0, 1)])
+        self.assertEqual(self.occupancy(self.other), 1)
+        self.assertEqual(reconcile_occupancy(), [])
+
+    def test_room_pages_need_no_queries_per_room(self):
+        def count(url_name):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(reverse(url_name)).status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.add_guest(self.room)
+        before = {name: count(name) for name in ('manage_buildings', 'manage_guests')}
+        for i in range(5):
+            self.add_guest(Room.objects.create(number=f'D-2{i}', room_type='single', price=7000))
+        self.assertEqual({name: count(name) for name in before}, before)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class RoomQuerySetTests(TestCase):
+    """Room.objects.with_occupancy() is the shared fast path for room listings"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.empty = Room.objects.create(number='E-101', room_type='double', price=7000, capacity=2)
+        self.partial = Room.objects.create(number='E-102', room_type='double', price=7000, capacity=2, occupancy=1)
+        self.full = Room.objects.create(number='E-103', room_type='single', price=7000, capacity=1, occupancy=1)
+        self.hidden = Room.objects.create(number='E-104', room_type='single', price=7000, is_available=False)
+        Guest.objects.create(first_name='Part', last_name='Tenant', room=self.partial)
+        Guest.objects.create(first_name='Full', last_name='Tenant', room=self.full)
+
+    def test_annotations(self):
+        rooms = {r.number: r for r in Room.objects.with_occupancy()}
+        self.assertEqual([rooms[n].free_slots for n in ('E-101', 'E-102', 'E-103', 'E-104')], [2, 1, 0, 1])
+        self.assertEqual([rooms[n].occupancy_status for n in ('E-101', 'E-102', 'E-103')], ['empty', 'partial', 'full'])
+        self.assertEqual(sorted(Room.objects.bookable().values_list('number', flat=True)), ['E-101', 'E-102'])
+
+    def test_tenants_prefetched(self):
+        with self.assertNumQueries(2):
+            tenants = {r.number: [g.first_name for g in r.current_tenants] for r in Room.objects.with_occupancy(tenants=True)}
+        self.assertEqual(tenants['E-102'], ['Part'])
+        self.assertEqual(tenants['E-101'], [])
+
+    def test_available_rooms_respects_capacity(self):
+        response = self.client.get(reverse('get_available_rooms'))
+        rooms = json.loads(response.content)['rooms']
+        self.assertEqual([(r['number'], r['free_slots']) for r in rooms], [('E-101', 2), ('E-102', 1)])
+
+    def test_dashboard_query_count_constant(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+            return len(ctx.captured_queries)
+
+        before = count()
+        for i in range(5):
+            room = Room.objects.create(number=f'E-2{i}', room_type='single', price=7000, occupancy=1)
+            Guest.objects.create(first_name='More', last_name=str(i), room=room)
+        self.assertEqual(count(), before)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class RoomBuildingTests(TestCase):
+    """Room.building is derived from the number and drives building grouping"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+
+    def test_building_code_from_number(self):
+        numbers = {'A-101': 'M1', 'M1-2': 'M1', 'B-101': '1', 'D-7': '3', 'ZZ-1': 'ZZ', '101': 'Other'}
+        for number, code in numbers.items():
+            self.assertEqual(Room.objects.create(number=number, room_type='single', price=5000).building, code)
+
+    def test_renumbering_moves_room(self):
+        room = Room.objects.create(number='B-101', room_type='single', price=5000)
+        room.number = 'C-101'
+        room.save(update_fields=['number'])
+        room.refresh_from_db()
+        self.assertEqual((room.building, room.building_label), ('2', 'Building 2'))
+
+    def test_building_totals(self):
+        Room.objects.create(number='B-101', room_type='double', price=5000, capacity=2, occupancy=1)
+        Room.objects.create(number='B-102', room_type='single', price=5000, is_available=False)
+        Room.objects.create(number='A-101', room_type='single', price=5000)
+        totals = {row['building']: row for row in Room.objects.building_totals()}
+        self.assertEqual(totals['1']['rooms'], 2)
+        self.assertEqual(totals['1']['capacity_total'], 3)
+        self.assertEqual(totals['1']['occupied'], 1)
+        self.assertEqual(totals['1']['unavailable_rooms'], 1)
+        self.assertEqual(totals['M1']['rooms'], 1)
+
+    def test_manage_buildings_groups_by_code(self):
+        Room.objects.create(number='A-101', room_type='single', price=5000)
+        Room.objects.create(number='C-101', room_type='single', price=5000)
+        response = self.client.get(reverse('manage_buildings'))
+        self.assertEqual([name for name, _ in response.context['buildings']], ['M1', '2'])
+
+    def test_buildings_sorted_by_numeric_code(self):
+        for number in ('L-101', 'C-101', 'A-101', 'K-101'):
+            Room.objects.create(number=number, room_type='single', price=5000)
+        response = self.client.get(reverse('manage_buildings'))
+        self.assertEqual([name for name, _ in response.context['buildings']], ['M1', '2', '10', '11'])
+
+    def test_migration_merges_colliding_building_rollups(self):
+        from django.apps import apps
+        migration = importlib.import_module('rental.migrations.0014_room_building')
+        month = date(2024, 1, 1)
+        BuildingMonthlyCollection.objects.create(building='A', month=month, rooms_billed=2, expected_amount=10000, collected_amount=4000, pending_count=1)
+        BuildingMonthlyCollection.objects.create(building='M1', month=month, rooms_billed=1, expected_amount=5000, collected_amount=5000, paid_count=1)
+        migration.fill_building(apps, None)
+        row = BuildingMonthlyCollection.objects.get()
+        self.assertEqual((row.building, row.rooms_billed, row.expected_amount, row.collected_amount), ('M1', 3, 15000, 9000))
+        self.assertEqual((row.pending_count, row.paid_count), (1, 1))
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class CacheInvalidationTests(TestCase):
+    """Cached aggregates are rebuilt after any write to the tables they read"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='F-101', room_type='double', price=6000, capacity=2)
+
+    def test_cached_value_reused_until_write(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return list(Room.objects.values_list('number', flat=True))
+
+        self.assertEqual(cached('numbers', (ROOMS,), build), ['F-101'])
+        with self.assertNumQueries(0):
+            self.assertEqual(cached('numbers', (ROOMS,), build), ['F-101'])
+        Room.objects.create(number='F-102', room_type='single', price=5000)
+        self.assertEqual(cached('numbers', (ROOMS,), build), ['F-101', 'F-102'])
+        self.assertEqual(len(calls), 2)
+
+    def test_model_writes_bump_generations(self):
+        rooms, payments = generations(ROOMS, PAYMENTS)
+        guest = Guest.objects.create(first_name='Cache', last_name='Guest', room=self.room)
+        self.assertGreater(generations(ROOMS)[0], rooms)
+        MonthlyPayment.objects.create(room=self.room, month=date(2025, 11, 1), rent_amount=6000)
+        self.assertGreater(generations(PAYMENTS)[0], payments)
+
+        rooms = generations(ROOMS)[0]
+        guest.delete()
+        self.assertGreater(generations(ROOMS)[0], rooms)
+
+    def test_bumped_generation_does_not_expire(self):
+        # The file cache's incr() is a get + set with the default TIMEOUT
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+                'TIMEOUT': settings.CACHE_TIMEOUT,
+            }}
+            with override_settings(CACHES=file_cache):
+                before = generations(ROOMS)[0]
+                Room.objects.create(number='F-102', room_type='single', price=5000)
+                bumped = generations(ROOMS)[0]
+                self.assertGreater(bumped, before)
+                # Well past CACHE_TIMEOUT the counter must still be there, not reseeded
+                later = time.time() + 10 * settings.CACHE_TIMEOUT
+                with mock.patch('django.core.cache.backends.filebased.time.time', return_value=later):
+                    self.assertEqual(cache.get('gen:rooms'), bumped)
+
+    def test_queryset_update_paths_bump_generation(self):
+        rooms = generations(ROOMS)[0]
+        refresh_occupancy(self.room.id)
+        self.assertGreater(generations(ROOMS)[0], rooms)
+
+    def test_available_rooms_never_stale(self):
+        url = reverse('get_available_rooms')
+        self.assertEqual([r['free_slots'] for r in json.loads(self.client.get(url).content)['rooms']], [2])
+        Guest.objects.create(first_name='Cache', last_name='Guest', room=self.room)
+        refresh_occupancy(self.room.id)
+        self.assertEqual([r['free_slots'] for r in json.loads(self.client.get(url).content)['rooms']], [1])
+
+    def test_dashboard_warm_hit_skips_room_queries(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+            return len(ctx.captured_queries)
+
+        cold = count()
+        self.assertLess(count(), cold)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class GuestApiTests(TestCase):
+    """/api/guests/ pages with a (created_at, id) cursor and projects fields"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.b_room = Room.objects.create(number='B-101', room_type='double', price=6000, capacity=6)
+        self.c_room = Room.objects.create(number='C-101', room_type='double', price=6000, capacity=6)
+        for i in range(5):
+            Guest.objects.create(first_name=f'B{i}', last_name='Guest', room=self.b_room, check_in_date=date(2025, 1, i + 1))
+        Guest.objects.create(first_name='C0', last_name='Guest', room=self.c_room, check_in_date=date(2025, 3, 1))
+        Guest.objects.create(first_name='Old', last_name='Guest', room=self.c_room, is_active=False)
+
+    def get(self, **params):
+        response = self.client.get(reverse('get_guests'), params)
+        return response.status_code, json.loads(response.content)
+
+    def test_cursor_walks_every_active_guest_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, 'fields': 'id,first_name'}
+            if cursor:
+                params['cursor'] = cursor
+            status, data = self.get(**params)
+            self.assertEqual(status, 200)
+            seen += [g['first_name'] for g in data['guests']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['C0', 'B4', 'B3', 'B2', 'B1', 'B0'])
+        self.assertNotIn('guest_list', data)
+
+    def test_fields_projection(self):
+        status, data = self.get(fields='full_name,room', room=self.c_room.id)
+        self.assertEqual(data['guests'], [{
+            'full_name': 'C0 Guest',
+            'room': {'id': self.c_room.id, 'number': 'C-101', 'price': '6000.00', 'agreed_rent': None},
+        }])
+
+    def test_filters(self):
+        status, data = self.get(fields='first_name', building='2', active='all')
+        self.assertEqual(sorted(g['first_name'] for g in data['guests']), ['C0', 'Old'])
+        status, data = self.get(fields='first_name', check_in_from='2025-01-02', check_in_to='2025-01-03')
+        self.assertEqual([g['first_name'] for g in data['guests']], ['B2', 'B1'])
+        status, data = self.get(fields='first_name', archived='true')
+        self.assertEqual(len(data['guests']), 7)
+
+    def test_bad_input_rejected(self):
+        self.assertEqual(self.get(fields='password')[0], 400)
+        self.assertEqual(self.get(cursor='not-a-cursor')[0], 400)
+        self.assertEqual(self.get(check_in_from='01/02/2025')[0], 400)
+
+    def test_query_count_independent_of_page(self):
+        with self.assertNumQueries(3):
+            self.get(limit=2)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class SyncApiTests(TestCase):
+    """/api/sync/ returns only rows changed since the token, plus tombstones"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='G-101', room_type='double', price=6000, capacity=2)
+        self.other = Room.objects.create(number='G-102', room_type='single', price=5000)
+
+    def sync(self, since=None):
+        params = {'since': since} if since else {}
+        response = self.client.get(reverse('sync_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def age_everything(self):
+        # Push existing rows outside the overlap window of the next token
+        old = timezone.now() - timedelta(minutes=5)
+        for model in (Room, Guest, MonthlyPayment, ElectricityBill):
+            model.objects.update(updated_at=old)
+
+    def test_first_call_only_returns_token(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['rooms'], [])
+
+    def test_changes_and_tombstones(self):
+        guest = Guest.objects.create(first_name='Sync', last_name='Guest', room=self.room)
+        payment = MonthlyPayment.objects.create(room=self.other, month=date(2025, 11, 1), rent_amount=5000)
+        self.age_everything()
+        token = self.sync()['token']
+
+        guest.phone = '9999999999'
+        guest.save()
+        refresh_occupancy(self.room.id)
+        payment_id = payment.id
+        payment.delete()
+
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual([g['phone'] for g in data['guests']], ['9999999999'])
+        self.assertEqual([r['number'] for r in data['rooms']], ['G-101'])
+        self.assertEqual(data['payments'], [])
+        self.assertEqual(data['deleted']['payments'], [payment_id])
+
+    def test_partial_room_save_moves_updated_at(self):
+        self.age_everything()
+        token = self.sync()['token']
+        self.other.is_available = False
+        self.other.save(update_fields=['is_available'])
+        self.assertEqual([r['number'] for r in self.sync(token)['rooms']], ['G-102'])
+
+    def test_room_delete_reports_unassigned_guests(self):
+        guest = Guest.objects.create(first_name='Sync', last_name='Guest', room=self.room)
+        self.age_everything()
+        token = self.sync()['token']
+        room_id = self.room.id
+        self.room.delete()
+
+        data = self.sync(token)
+        self.assertEqual([(g['id'], g['room_id']) for g in data['guests']], [(guest.id, None)])
+        self.assertEqual(data['deleted']['rooms'], [room_id])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('sync_changes'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class PaymentHistoryTests(TestCase):
+    """get_payment_history loads months and records with a fixed number of queries"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='H-101', room_type='single', price=5000)
+
+    def add_months(self, count, start=1):
+        for m in range(start, start + count):
+            payment = MonthlyPayment.objects.create(room=self.room, month=date(2024, m, 1), rent_amount=5000)
+            for day in (5, 10):
+                PaymentRecord.objects.create(monthly_payment=payment, payment_date=date(2024, m, day), payment_amount=1000)
+
+    def get(self, **params):
+        response = self.client.get(reverse('get_payment_history', args=[self.room.id]), params)
+        return json.loads(response.content)
+
+    def test_query_count_constant(self):
+        self.add_months(2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.get()
+        self.add_months(6, start=3)
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            data = self.get()
+        self.assertEqual(len(data['history']), 8)
+        self.assertEqual([r['date'] for r in data['history'][0]['records']], ['2024-08-10', '2024-08-05'])
+
+    def test_month_range_and_limit(self):
+        self.add_months(6)
+        data = self.get(**{'from': '2024-02', 'to': '2024-05', 'limit': 3})
+        self.assertEqual([h['month'] for h in data['history']], ['May 2024', 'April 2024', 'March 2024'])
+        self.assertTrue(data['has_more'])
+        self.assertFalse(self.get(**{'from': '2024-05'})['has_more'])
+
+    def test_bad_range_rejected(self):
+        response = self.client.get(reverse('get_payment_history', args=[self.room.id]), {'from': 'May'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class ManagePaymentsQueryTests(TestCase):
+    """manage_payments renders the ledger in a constant number of queries"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+
+    def add_payments(self, prefix, count):
+        for i in range(count):
+            room = Room.objects.create(number=f'{prefix}-{i}', room_type='single', price=5000)
+            payment = MonthlyPayment.objects.create(
+                room=room, month=date(2025, 11, 1), rent_amount=5000, paid_amount=1000, payment_status='partial'
+            )
+            PaymentRecord.objects.create(monthly_payment=payment, payment_date=date(2025, 11, 3), payment_amount=1000)
+
+    def render(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('manage_payments'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_constant_and_records_rendered(self):
+        self.add_payments('J', 2)
+        _, before = self.render()
+        self.add_payments('K', 6)
+        response, after = self.render()
+        self.assertEqual(after, before)
+        self.assertContains(response, 'data-amount="1000.00"', count=8)
+
+    def test_overdue_rows_listed_and_payable(self):
+        room = Room.objects.create(number='J-1', room_type='single', price=5000)
+        overdue = MonthlyPayment.objects.create(room=room, month=date(2025, 10, 1), rent_amount=5000, payment_status='overdue')
+        response, _ = self.render()
+        self.assertIn(overdue, response.context['monthly_payments'])
+        self.assertContains(response, f'<option value="{overdue.id}">')
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class ManageElectricityBillsTests(TestCase):
+    """manage_electricity_bills filters and paginates in SQL with a one-query summary"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+
+    def add_bills(self, prefix, count, status='pending', month=date(2025, 10, 1)):
+        for i in range(count):
+            room = Room.objects.create(number=f'{prefix}-{i}', room_type='single', price=5000)
+            ElectricityBill.objects.create(
+                room=room, month=month, starting_reading=10, ending_reading=60, units_consumed=50,
+                rate_per_unit=6, bill_amount=300, paid_amount=100 if status != 'paid' else 300,
+                bill_status=status, due_date=date(2025, 11, 5),
+            )
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('manage_electricity_bills'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_summary_and_filters(self):
+        self.add_bills('B', 2)
+        self.add_bills('C', 1, status='overdue')
+        self.add_bills('D', 1, status='paid', month=date(2025, 9, 1))
+        response, _ = self.get()
+        self.assertEqual(response.context['bill_stats'], {
+            'pending': 2, 'paid': 1, 'overdue': 1, 'total_pending_amount': Decimal('600.00'),
+        })
+        response, _ = self.get(building='1')
+        self.assertEqual([b.room.number for b in response.context['bills']], ['B-0', 'B-1'])
+        response, _ = self.get(status='paid')
+        self.assertEqual([b.room.number for b in response.context['bills']], ['D-0'])
+        response, _ = self.get(month='2025-10', status='overdue')
+        self.assertEqual(response.context['bill_stats']['overdue'], 1)
+
+    def test_pagination_reaches_old_bills_in_constant_queries(self):
+        self.add_bills('B', 3)
+        _, before = self.get()
+        self.add_bills('E', 60, month=date(2024, 1, 1))
+        response, after = self.get(page=2)
+        self.assertEqual(after, before)
+        self.assertEqual(response.context['bills'].paginator.count, 63)
+        self.assertEqual(len(response.context['bills']), 13)
+
+
+class MonthlyRentGenerationTests(TestCase):
+    """generate_monthly_rent bills every occupied room once per month"""
+
+    def setUp(self):
+        self.month = date(2025, 12, 1)
+        self.agreed = Room.objects.create(number='L-101', room_type='single', price=5000, agreed_rent=4500, occupancy=1)
+        self.listed = Room.objects.create(number='L-102', room_type='single', price=5200, occupancy=1)
+        self.vacant = Room.objects.create(number='L-103', room_type='single', price=5000)
+        self.guest = Guest.objects.create(first_name='Rent', last_name='Payer', room=self.listed)
+        MonthlyPayment.objects.create(room=self.agreed, month=self.month, rent_amount=4000, paid_amount=4000, payment_status='paid')
+
+    def test_bills_occupied_rooms_and_skips_existing(self):
+        self.assertEqual(generate_monthly_rent(self.month), 1)
+        payments = {p.room.number: p for p in MonthlyPayment.objects.filter(month=self.month)}
+        self.assertEqual(sorted(payments), ['L-101', 'L-102'])
+        self.assertEqual(payments['L-101'].rent_amount, Decimal('4000'))
+        self.assertEqual(payments['L-102'].rent_amount, Decimal('5200'))
+        self.assertEqual(payments['L-102'].guest, self.guest)
+        self.assertEqual(generate_monthly_rent(self.month), 0)
+        self.assertEqual(verify_collection_rollups(self.month), [])
+
+    def test_agreed_rent_wins(self):
+        generate_monthly_rent(date(2026, 1, 1))
+        self.assertEqual(MonthlyPayment.objects.get(room=self.agreed, month=date(2026, 1, 1)).rent_amount, Decimal('4500'))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_monthly_rent', '--month', '2026-02', stdout=out)
+        self.assertIn('Created 2 rent rows for February 2026', out.getvalue())
+
+
+class OverdueSweepTests(TestCase):
+    """sweep_overdue flips late rows with set-based UPDATEs and records the run"""
+
+    def setUp(self):
+        self.room = Room.objects.create(number='N-101', room_type='single', price=5000)
+        self.late = MonthlyPayment.objects.create(room=self.room, month=date(2025, 10, 1), rent_amount=5000)
+        self.partial = MonthlyPayment.objects.create(
+            room=self.room, month=date(2025, 11, 1), rent_amount=5000, paid_amount=1000, payment_status='partial'
+        )
+        self.paid = MonthlyPayment.objects.create(
+            room=self.room, month=date(2025, 9, 1), rent_amount=5000, paid_amount=5000, payment_status='paid'
+        )
+        self.current = MonthlyPayment.objects.create(room=self.room, month=date(2025, 12, 1), rent_amount=5000)
+        bill = dict(room=self.room, starting_reading=0, ending_reading=10, units_consumed=10, rate_per_unit=6, bill_amount=60)
+        self.late_bill = ElectricityBill.objects.create(month=date(2025, 10, 1), due_date=date(2025, 11, 5), **bill)
+        self.open_bill = ElectricityBill.objects.create(month=date(2025, 11, 1), due_date=date(2025, 12, 20), **bill)
+
+    def test_marks_only_late_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            run = sweep_overdue(date(2025, 12, 5))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        statuses = dict(MonthlyPayment.objects.values_list('month', 'payment_status'))
+        self.assertEqual(statuses, {
+            date(2025, 9, 1): 'paid', date(2025, 10, 1): 'overdue',
+            date(2025, 11, 1): 'overdue', date(2025, 12, 1): 'pending',
+        })
+        self.late_bill.refresh_from_db()
+        self.open_bill.refresh_from_db()
+        self.assertEqual((self.late_bill.bill_status, self.open_bill.bill_status), ('overdue', 'pending'))
+        self.assertEqual(run.rows_changed, 3)
+        self.assertEqual(run.details, {'rent': 2, 'electricity': 1, 'as_of': '2025-12-05'})
+        for month in (date(2025, 10, 1), date(2025, 11, 1)):
+            self.assertEqual(verify_collection_rollups(month), [])
+
+    def test_current_month_overdue_after_due_day(self):
+        sweep_overdue(date(2025, 12, 11))
+        self.current.refresh_from_db()
+        self.assertEqual(self.current.payment_status, 'overdue')
+
+    def test_command_records_job_run(self):
+        out = StringIO()
+        call_command('sweep_overdue', '--date', '2025-12-05', stdout=out)
+        self.assertIn('Marked 2 rent rows and 1 electricity bills overdue', out.getvalue())
+        self.assertEqual(JobRun.objects.get().job, 'sweep_overdue')
+
+
+class PaymentPostingTests(TestCase):
+    """post_rent_payment / post_electricity_payment update balances in SQL"""
+
+    def setUp(self):
+        self.room = Room.objects.create(number='P-101', room_type='single', price=5000)
+        self.payment = MonthlyPayment.objects.create(room=self.room, month=date(2025, 11, 1), rent_amount=5000)
+        self.bill = ElectricityBill.objects.create(
+            room=self.room, month=date(2025, 11, 1), starting_reading=0, ending_reading=50, units_consumed=50,
+            rate_per_unit=6, bill_amount=300, due_date=date(2025, 12, 5),
+        )
+
+    def test_stale_instances_do_not_lose_postings(self):
+        stale = MonthlyPayment.objects.get(pk=self.payment.pk)
+        post_rent_payment(self.payment.pk, Decimal('2000'), date(2025, 11, 3))
+        payment, _ = post_rent_payment(stale.pk, Decimal('3000'), date(2025, 11, 9))
+        self.assertEqual(payment.paid_amount, Decimal('5000'))
+        self.assertEqual((payment.payment_status, payment.paid_date), ('paid', date(2025, 11, 9)))
+        self.assertEqual(payment.payment_records.count(), 2)
+        self.assertEqual(verify_collection_rollups(date(2025, 11, 1)), [])
+
+    def test_overpayment_guard(self):
+        with self.assertRaises(PaymentError):
+            post_rent_payment(self.payment.pk, Decimal('6000'), date(2025, 11, 3), allow_overpayment=False)
+        with self.assertRaises(PaymentError):
+            post_electricity_payment(self.bill.pk, Decimal('0'), date(2025, 11, 3))
+        self.assertEqual(PaymentRecord.objects.count(), 0)
+
+    def test_partial_payment_keeps_overdue_status(self):
+        MonthlyPayment.objects.filter(pk=self.payment.pk).update(payment_status='overdue')
+        payment, _ = post_rent_payment(self.payment.pk, Decimal('1000'), date(2025, 12, 8))
+        self.assertEqual((payment.paid_amount, payment.payment_status), (Decimal('1000'), 'overdue'))
+        payment, _ = post_rent_payment(self.payment.pk, Decimal('4000'), date(2025, 12, 9))
+        self.assertEqual((payment.payment_status, payment.paid_date), ('paid', date(2025, 12, 9)))
+
+    def test_electricity_partial_keeps_status(self):
+        bill = post_electricity_payment(self.bill.pk, Decimal('100'), date(2025, 11, 20))
+        self.assertEqual((bill.paid_amount, bill.bill_status, bill.paid_date), (Decimal('100'), 'pending', None))
+        bill = post_electricity_payment(self.bill.pk, Decimal('200'), date(2025, 11, 21))
+        self.assertEqual((bill.bill_status, bill.paid_date), ('paid', date(2025, 11, 21)))
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class RecordPaymentViewTests(TestCase):
+    """record_payment accepts decimal amounts (it used to add a float to a Decimal)"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        room = Room.objects.create(number='P-201', room_type='single', price=5000)
+        self.payment = MonthlyPayment.objects.create(room=room, month=date(2025, 11, 1), rent_amount=5000)
+
+    def test_record_payment(self):
+        response = self.client.post(reverse('record_payment'), {
+            'payment_id': self.payment.pk, 'payment_amount': '1250.50', 'payment_date': '2025-11-04',
+        })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['payment'], {
+            'id': self.payment.pk, 'paid_amount': '1250.50', 'status': 'partial', 'remaining': '3749.50',
+        })
+
+
+@skipUnless(connection.features.has_select_for_update, 'needs a database with row locks (e.g. PostgreSQL)')
+class ConcurrentPaymentPostingTests(TransactionTestCase):
+    """Parallel postings against one row must all be counted (SQLite is covered by PaymentPostingTests)"""
+
+    def test_parallel_postings(self):
+        room = Room.objects.create(number='P-301', room_type='single', price=10000)
+        payment = MonthlyPayment.objects.create(room=room, month=date(2025, 11, 1), rent_amount=10000)
+        errors = []
+
+        def post():
+            try:
+                for _ in range(5):
+                    post_rent_payment(payment.pk, Decimal('100'), date(2025, 11, 3))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        payment.refresh_from_db()
+        self.assertEqual(payment.paid_amount, Decimal('2000'))
+        self.assertEqual(payment.payment_records.count(), 20)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class RecordPaymentBatchTests(TestCase):
+    """/api/payment/record-batch/ posts many payments in one transaction"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.payments = []
+        for i in range(3):
+            room = Room.objects.create(number=f'Q-{i}', room_type='single', price=5000)
+            self.payments.append(MonthlyPayment.objects.create(room=room, month=date(2025, 11, 1), rent_amount=5000))
+        rebuild_collection_rollups()
+
+    def post(self, items):
+        response = self.client.post(reverse('record_payment_batch'), json.dumps(items), content_type='application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_per_item_results(self):
+        first, second, _ = self.payments
+        status, data = self.post([
+            {'payment_id': first.pk, 'payment_amount': '3000', 'payment_date': '2025-11-02', 'payment_method': 'upi'},
+            {'payment_id': first.pk, 'payment_amount': '2000', 'payment_date': '2025-11-05'},
+            {'payment_id': second.pk, 'payment_amount': '-5', 'payment_date': '2025-11-05'},
+            {'payment_id': 999999, 'payment_amount': '100', 'payment_date': '2025-11-05'},
+            {'payment_id': second.pk, 'payment_amount': '100', 'payment_date': '05/11/2025'},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(data['posted'], 2)
+        self.assertEqual([r['success'] for r in data['results']], [True, True, False, False, False])
+        self.assertEqual(data['results'][3]['message'], 'Payment record not found')
+        # Each result shows the month as it stood after that item
+        self.assertEqual(data['results'][0]['payment'], {'id': first.pk, 'paid_amount': '3000.00', 'status': 'partial', 'remaining': '2000.00'})
+        self.assertEqual(data['results'][1]['payment'], {'id': first.pk, 'paid_amount': '5000.00', 'status': 'paid', 'remaining': '0.00'})
+        first.refresh_from_db()
+        self.assertEqual((first.paid_amount, first.payment_status, first.paid_date), (Decimal('5000'), 'paid', date(2025, 11, 5)))
+        self.assertEqual(first.payment_records.count(), 2)
+        self.assertEqual(verify_collection_rollups(date(2025, 11, 1)), [])
+
+    def test_partial_payment_keeps_overdue_status(self):
+        first, second, _ = self.payments
+        MonthlyPayment.objects.filter(pk__in=[first.pk, second.pk]).update(payment_status='overdue')
+        self.post([
+            {'payment_id': first.pk, 'payment_amount': '1000', 'payment_date': '2025-12-08'},
+            {'payment_id': second.pk, 'payment_amount': '5000', 'payment_date': '2025-12-08'},
+        ])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.payment_status, second.payment_status), ('overdue', 'paid'))
+
+    def test_query_count_independent_of_batch_size(self):
+        def count(items):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.post(items)[0], 200)
+            return len(ctx.captured_queries)
+
+        # Rollups are refreshed once per touched room, however many items hit it
+        item = lambda p: {'payment_id': p.pk, 'payment_amount': '100', 'payment_date': '2025-11-05'}
+        self.assertEqual(count([item(p) for p in self.payments]), count([item(p) for p in self.payments] * 4))
+        self.assertEqual(verify_collection_rollups(date(2025, 11, 1)), [])
+
+    def test_rejects_non_array(self):
+        self.assertEqual(self.post({'payment_id': 1})[0], 400)
+        self.assertEqual(self.post([])[0], 400)
+
+
+@override_settings(MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m], APPEND_SLASH=False)
+class IdempotencyKeyTests(TestCase):
+    """Retried POSTs with the same Idempotency-Key replay the first response"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        room = Room.objects.create(number='R-101', room_type='single', price=5000)
+        self.payment = MonthlyPayment.objects.create(room=room, month=date(2025, 11, 1), rent_amount=5000)
+
+    def pay(self, key=None, url='record_payment'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(reverse(url), {
+            'payment_id': self.payment.pk, 'payment_amount': '1000', 'payment_date': '2025-11-04',
+        }, **headers)
+
+    def test_retry_replays_without_reposting(self):
+        first = self.pay('retry-1')
+        second = self.pay('retry-1')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(PaymentRecord.objects.count(), 1)
+        self.pay('retry-2')
+        self.assertEqual(PaymentRecord.objects.count(), 2)
+
+    def test_without_header_every_post_runs(self):
+        self.pay()
+        self.pay()
+        self.assertEqual(PaymentRecord.objects.count(), 2)
+
+    def test_in_flight_and_reused_keys(self):
+        IdempotencyKey.objects.create(user=self.admin, key='busy', path=reverse('record_payment'))
+        self.assertEqual(self.pay('busy').status_code, 409)
+        self.pay('used')
+        self.assertEqual(self.pay('used', url='add_guest').status_code, 422)
+
+    def test_expired_keys_are_pruned(self):
+        self.pay('old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.pay('old')
+        self.assertEqual(PaymentRecord.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_dashboard_and_bill_endpoints_replay(self):
+        payment = {'monthly_payment_id': self.payment.pk, 'payment_amount': '1000', 'payment_date': '2025-11-04'}
+        bill = {'room_id': self.payment.room_id, 'month': '2025-11', 'due_date': '2025-12-05'}
+        for url, data, model in (
+            ('record_payment_dashboard', payment, PaymentRecord),
+            ('create_electricity_bill', bill, ElectricityBill),
+        ):
+            first = self.client.post(reverse(url), data, HTTP_IDEMPOTENCY_KEY=f'{url}-1')
+            second = self.client.post(reverse(url), data, HTTP_IDEMPOTENCY_KEY=f'{url}-1')
+            self.assertEqual(first.status_code, 200, first.content)
+            self.assertEqual(second['Idempotent-Replayed'], 'true')
+            self.assertEqual(model.objects.count(), 1)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class BookingBillingTests(TestCase):
+    """submit_booking bills the stay's months in a fixed number of queries"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='B-101', room_type='single', price=5000, agreed_rent=4800, capacity=2)
+
+    def book(self, email, check_in, check_out):
+        return self.client.post(reverse('submit_booking'), {
+            'room_id': self.room.pk, 'first_name': 'Stay', 'last_name': 'Guest', 'email': email,
+            'phone': '9999999999', 'id_type': 'aadhar', 'id_number': '1234', 'check_in_date': check_in,
+            'check_out_date': check_out,
+        })
+
+    def test_month_range(self):
+        self.assertEqual(month_range(date(2025, 11, 15), date(2026, 2, 1)),
+                         [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)])
+        self.assertEqual(month_range(date(2025, 11, 15), date(2025, 11, 20)), [date(2025, 11, 1)])
+
+    def test_bills_missing_months_only(self):
+        MonthlyPayment.objects.create(room=self.room, month=date(2025, 8, 1), rent_amount=4000,
+                                      paid_amount=4000, payment_status='paid')
+        response = self.book('stay@test.com', '2025-07-20', '2025-10-05')
+        self.assertEqual(response.status_code, 200)
+        payments = {p.month: p for p in MonthlyPayment.objects.filter(room=self.room)}
+        self.assertEqual(sorted(payments), [date(2025, 7, 1), date(2025, 8, 1), date(2025, 9, 1), date(2025, 10, 1)])
+        self.assertEqual(payments[date(2025, 8, 1)].payment_status, 'paid')
+        self.assertEqual(payments[date(2025, 9, 1)].rent_amount, Decimal('4800'))
+        self.assertEqual(payments[date(2025, 9, 1)].guest.email, 'stay@test.com')
+        self.assertEqual(verify_collection_rollups(date(2025, 9, 1)), [])
+
+    def test_query_count_independent_of_stay_length(self):
+        def count(email, check_out):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.book(email, '2025-01-10', check_out).status_code, 200)
+            return len(ctx)
+
+        short = count('short@test.com', '2025-03-01')
+        MonthlyPayment.objects.all().delete()
+        self.assertEqual(count('long@test.com', '2026-12-31'), short)
+        self.assertEqual(MonthlyPayment.objects.filter(room=self.room).count(), 24)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class RoomAssignmentTests(TestCase):
+    """Guest views never put more active tenants in a room than its capacity"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='C-101', room_type='double', price=6000, capacity=2)
+        self.other = Room.objects.create(number='C-102', room_type='single', price=6000, capacity=1)
+
+    def test_recounts_instead_of_trusting_the_counter(self):
+        # Inserted behind the counter's back: occupancy still says 0
+        Guest.objects.create(first_name='Direct', last_name='Insert', room=self.other)
+        response = self.client.post(reverse('add_guest'), {'first_name': 'Late', 'last_name': 'Comer', 'room_id': self.other.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already full', json.loads(response.content)['message'])
+        self.assertEqual(Guest.objects.filter(room=self.other).count(), 1)
+
+    def test_all_three_views_check_capacity(self):
+        Guest.objects.create(first_name='First', last_name='Tenant', room=self.other)
+        mover = Guest.objects.create(first_name='Mover', last_name='Tenant', room=self.room)
+        response = self.client.post(reverse('update_guest', args=[mover.id]), {
+            'first_name': 'Mover', 'last_name': 'Tenant', 'room_id': self.other.id,
+        })
+        self.assertEqual(response.status_code, 400)
+        mover.refresh_from_db()
+        self.assertEqual(mover.room, self.room)
+
+        response = self.client.post(reverse('submit_booking'), {
+            'room_id': self.other.id, 'first_name': 'Book', 'last_name': 'Er', 'email': 'book@test.com',
+            'phone': '9999999999', 'id_type': 'aadhar', 'id_number': '1', 'check_in_date': '2025-07-01',
+            'check_out_date': '2025-08-01',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Guest.objects.filter(email='book@test.com').exists())
+
+    def test_guest_does_not_count_against_own_room(self):
+        guest = Guest.objects.create(first_name='Only', last_name='Tenant', room=self.other)
+        self.assertEqual(assign_room(guest, self.other.id), self.other)
+        with self.assertRaises(RoomFullError):
+            assign_room(Guest(first_name='New'), self.other.id)
+
+
+@skipUnless(connection.features.has_select_for_update, 'needs a database with row locks (e.g. PostgreSQL)')
+class ConcurrentRoomAssignmentTests(TransactionTestCase):
+    """Parallel assignments to one room stop at its capacity (SQLite is covered by RoomAssignmentTests)"""
+
+    def test_parallel_assignments(self):
+        room = Room.objects.create(number='C-201', room_type='triple', price=6000, capacity=3)
+        outcomes = []
+
+        def assign(n):
+            try:
+                with transaction.atomic():
+                    guest = Guest(first_name=f'Racer {n}', last_name='Tenant')
+                    assign_room(guest, room.pk)
+                    guest.save()
+                    refresh_occupancy(room.pk)
+                outcomes.append('ok')
+            except RoomFullError:
+                outcomes.append('full')
+            except Exception as e:
+                outcomes.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=assign, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['full'] * 5 + ['ok'] * 3)
+        room.refresh_from_db()
+        self.assertEqual(room.occupancy, 3)
+        self.assertEqual(Guest.objects.filter(room=room, is_active=True).count(), 3)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class AvailabilityTests(TestCase):
+    """/api/availability/ reports free slots per room per day from bookings and guest stays"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.double = Room.objects.create(number='A-101', room_type='double', price=6000, capacity=2)
+        self.single = Room.objects.create(number='B-101', room_type='single', price=6000, capacity=1)
+
+    def test_free_slots_per_day(self):
+        # A booking and its guest describe the same stay and must count once
+        Booking.objects.create(room=self.double, customer_name='Stay', check_in=date(2025, 7, 2), check_out=date(2025, 7, 4))
+        Guest.objects.create(first_name='Stay', last_name='Guest', room=self.double,
+                             check_in_date=date(2025, 7, 2), check_out_date=date(2025, 7, 4))
+        # No dates: occupies the whole window
+        Guest.objects.create(first_name='Long', last_name='Term', room=self.double)
+        Guest.objects.create(first_name='Gone', last_name='Guest', room=self.single, is_active=False)
+        Booking.objects.create(room=self.single, customer_name='Old', check_in=date(2025, 6, 1),
+                               check_out=date(2025, 7, 3), is_active=False)
+
+        rooms = {row['number']: row['free'] for row in free_slots(date(2025, 7, 1), date(2025, 7, 5))}
+        self.assertEqual(rooms, {'A-101': [1, 0, 0, 1, 1], 'B-101': [1, 1, 1, 1, 1]})
+
+    def test_endpoint(self):
+        Guest.objects.create(first_name='Open', last_name='Ended', room=self.single, check_in_date=date(2025, 7, 3))
+        response = self.client.get(reverse('get_availability'), {'from': '2025-07-01', 'to': '2025-07-04', 'building': '1'})
+        data = json.loads(response.content)
+        self.assertEqual((data['from'], data['days']), ('2025-07-01', 4))
+        self.assertEqual([(r['number'], r['free']) for r in data['rooms']], [('B-101', [1, 1, 0, 0])])
+
+        for params in ({'from': '2025-07-05', 'to': '2025-07-01'}, {'from': '2025-01-01', 'to': '2026-01-02'}, {'to': 'July'}):
+            self.assertEqual(self.client.get(reverse('get_availability'), params).status_code, 400)
+
+    def test_query_count_independent_of_stays(self):
+        def count():
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('get_availability'), {'from': '2025-01-01', 'to': '2025-12-31'})
+            return len(ctx)
+
+        before = count()
+        for month in range(1, 13):
+            Booking.objects.create(room=self.double, customer_name='B', check_in=date(2025, month, 1),
+                                   check_out=date(2025, month, 20))
+            Guest.objects.create(first_name='G', last_name='S', room=self.single,
+                                 check_in_date=date(2025, month, 5), check_out_date=date(2025, month, 25))
+        self.assertEqual(count(), before)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class OccupancySnapshotTests(TestCase):
+    """snapshot_occupancy rewrites only the days touched by guest and booking changes"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.today = date(2025, 7, 1)
+        self.room = Room.objects.create(number='A-101', room_type='double', price=6000, capacity=2)
+        self.other = Room.objects.create(number='B-101', room_type='single', price=6000, capacity=1)
+        self.guest = Guest.objects.create(first_name='Stay', last_name='Guest', room=self.room,
+                                          check_in_date=date(2025, 7, 10), check_out_date=date(2025, 7, 20))
+
+    def occupied(self, day, building='M1'):
+        return OccupancySnapshot.objects.get(day=day, building=building).occupied
+
+    def test_first_run_fills_window_then_only_dirty_days(self):
+        run = refresh_snapshots(self.today)
+        self.assertEqual(run.details['days'], 731)
+        self.assertEqual(OccupancySnapshot.objects.count(), 731 * 2)
+        self.assertEqual((self.occupied(date(2025, 7, 9)), self.occupied(date(2025, 7, 10))), (0, 1))
+        self.assertEqual(self.occupied(date(2025, 7, 20)), 0)
+        self.assertFalse(OccupancyDirtyRange.objects.exists())
+        self.assertEqual(refresh_snapshots(self.today).details['days'], 0)
+
+        # Moving the stay dirties both the old and the new days
+        self.guest.check_in_date, self.guest.check_out_date = date(2025, 7, 15), date(2025, 7, 25)
+        self.guest.save()
+        self.guest.first_name = 'Renamed'
+        self.guest.save()
+        run = refresh_snapshots(self.today)
+        self.assertEqual(run.details['days'], 15)
+        self.assertEqual((self.occupied(date(2025, 7, 12)), self.occupied(date(2025, 7, 24))), (0, 1))
+
+        Booking.objects.create(room=self.other, customer_name='Short', check_in=date(2025, 8, 1), check_out=date(2025, 8, 3))
+        self.assertEqual(refresh_snapshots(self.today).details['days'], 2)
+        self.assertEqual(self.occupied(date(2025, 8, 2), building='1'), 1)
+
+    def test_command_and_calendar(self):
+        out = StringIO()
+        call_command('snapshot_occupancy', '--date', '2025-07-01', stdout=out)
+        self.assertIn('Recomputed 731 days', out.getvalue())
+
+        response = self.client.get(reverse('occupancy_calendar'), {'from': '2025-07-09', 'to': '2025-07-11'})
+        data = json.loads(response.content)
+        self.assertEqual(data['dates'], ['2025-07-09', '2025-07-10', '2025-07-11'])
+        self.assertEqual([(b['code'], b['capacity'], b['occupied']) for b in data['buildings']],
+                         [('1', 1, [0, 0, 0]), ('M1', 2, [0, 1, 1])])
+        self.assertEqual(self.client.get(reverse('occupancy_calendar'), {'from': '2025-07-11', 'to': '2025-07-01'}).status_code, 400)
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class CachePolicyTests(TestCase):
+    """Every route gets the Cache-Control its data allows, and nothing else is shared-cacheable"""
+
+    # GET as a signed-in admin; unlisted routes are POST-only (405) or carry tenant data
+    EXPECTED_GET = {
+        'home': PRIVATE,
+        'get_guests': PRIVATE,
+        'get_available_rooms': PRIVATE,
+        'get_availability': PRIVATE,
+        'get_room_details': PRIVATE,
+        'get_room_tenants': PRIVATE,
+        'get_payment_history': PRIVATE,
+        'get_electricity_history': PRIVATE,
+        'occupancy_calendar': PRIVATE,
+    }
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.room = Room.objects.create(number='A-101', room_type='single', price=5000)
+
+    def test_every_rental_url(self):
+        from rental.urls import urlpatterns
+
+        for pattern in urlpatterns:
+            with self.subTest(pattern.name):
+                # Re-login each time: GET /logout/ signs the client out
+                self.client.force_login(self.admin)
+                kwargs = {name: self.room.pk for name in pattern.pattern.converters}
+                response = self.client.get(reverse(pattern.name, kwargs=kwargs))
+                expected = self.EXPECTED_GET.get(pattern.name, NO_STORE)
+                if expected != NO_STORE:
+                    self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Cache-Control'], expected)
+
+    def test_home_is_public_for_anonymous_users(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['Cache-Control'], PUBLIC_PAGE)
+
+    def test_writes_and_errors_are_never_stored(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.post(reverse('get_guests'))['Cache-Control'], NO_STORE)
+        self.assertEqual(self.client.post(reverse('record_payment'))['Cache-Control'], NO_STORE)
+        self.assertEqual(self.client.get(reverse('get_room_details', args=[999]))['Cache-Control'], NO_STORE)
+
+    @override_settings(WHITENOISE_MAX_AGE=3600)
+    def test_static_files_cached_by_whitenoise(self):
+        response = self.client.get(f'{settings.STATIC_URL}rental/js/utils.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'max-age=3600, public')
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class ConditionalGetTests(TestCase):
+    """Read APIs send generation ETags and answer a matching If-None-Match with a bare 304"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        self.room = Room.objects.create(number='E-101', room_type='double', price=6000, capacity=2)
+        self.guest = Guest.objects.create(first_name='Etag', last_name='Tenant', room=self.room)
+
+    def urls(self):
+        return [reverse(name, args=args) for name, args in (
+            ('get_guests', []), ('get_available_rooms', []), ('get_room_tenants', [self.room.pk]),
+            ('get_payment_history', [self.room.pk]), ('get_electricity_history', [self.room.pk]),
+            ('get_room_details', [self.room.pk]),
+        )]
+
+    def test_matching_etag_skips_the_view(self):
+        for url in self.urls():
+            with self.subTest(url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                with CaptureQueriesContext(connection) as ctx:
+                    second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(second.status_code, 304)
+                self.assertEqual(second.content, b'')
+                self.assertEqual([q['sql'] for q in ctx.captured_queries if 'rental_' in q['sql']], [])
+
+    def test_writes_change_the_etag(self):
+        url = reverse('get_room_tenants', args=[self.room.pk])
+        etag = self.client.get(url)['ETag']
+        self.guest.phone = '9876543210'
+        self.guest.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['tenants'][0]['phone'], '9876543210')
+
+        url = reverse('get_payment_history', args=[self.room.pk])
+        etag = self.client.get(url)['ETag']
+        payment = MonthlyPayment.objects.create(room=self.room, month=date(2025, 11, 1), rent_amount=6000)
+        post_rent_payment(payment.pk, Decimal('100'), date(2025, 11, 2))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_dashboard_room_modal_revalidates_with_utils(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, f'<script src="{settings.STATIC_URL}rental/js/utils.js"></script>', html=False)
+        self.assertContains(response, 'const canReadRoomApis = true;')
+        for name in ('get_room_details', 'get_room_tenants', 'get_payment_history', 'get_electricity_history'):
+            self.assertContains(response, reverse(name, args=[0]))
+        self.assertContains(response, 'conditionalGetJSON(roomApiUrl(', count=4)
+
+        # The read APIs are admin-only, so other staff keep the embedded data
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='clerk', password='password'))
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'const canReadRoomApis = false;')
+        self.assertNotContains(response, 'id="detailRentHistory"')
+
+
+class LoginRequiredMiddlewareTests(TestCase):
+    """Anonymous users are sent to login except on the whitelist, which never loads the session"""
+
+    def test_whitelist(self):
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('health_check')).status_code, 200)
+        self.assertEqual(self.client.get('/favicon.ico').status_code, 301)
+        # '/' is an exact entry, not a prefix that lets everything through
+        response = self.client.get(reverse('manage_guests'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], reverse('login'))
+
+    def test_exempt_paths_skip_user_loading(self):
+        middleware = LoginRequiredMiddleware(lambda request: HttpResponse())
+        # RequestFactory requests have no .user: reading it would raise AttributeError
+        for path in ('/', '/health/', '/api/guests/', f'{settings.STATIC_URL}rental/js/utils.js', f'{settings.MEDIA_URL}x.jpg'):
+            self.assertEqual(middleware(RequestFactory().get(path)).status_code, 200)
+        with self.assertRaises(AttributeError):
+            middleware(RequestFactory().get('/dashboard/'))
+
+    def test_signed_in_users_pass(self):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_superuser(username='admin', email='admin@test.com', password='password'))
+        self.assertEqual(self.client.get(reverse('manage_guests')).status_code, 200)
+
+
+class SecurityHeadersTests(TestCase):
+    """Security headers come from settings, once each, in sync and async stacks"""
+
+    def test_headers_on_a_page(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['Content-Security-Policy'], (
+            "default-src 'self'; script-src 'self' 'unsafe-inline'; "
+            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com https://fonts.gstatic.com; "
+            "img-src 'self' data: https:; font-src 'self' data: https://fonts.googleapis.com https://fonts.gstatic.com; "
+            "connect-src 'self'; frame-ancestors 'none'; base-uri 'self'; form-action 'self';"
+        ))
+        self.assertTrue(response['Permissions-Policy'].startswith('geolocation=(), microphone=()'))
+        # Sent by SecurityMiddleware / XFrameOptionsMiddleware from settings
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Referrer-Policy'], 'strict-origin-when-cross-origin')
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+
+    def test_async_stack(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = SecurityHeadersMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = asyncio.run(middleware(RequestFactory().get('/')))
+        self.assertEqual(response['Accept-CH'], 'DPR, Viewport-Width, Width')
+        self.assertFalse(iscoroutinefunction(SecurityHeadersMiddleware(lambda request: HttpResponse())))
+
+
+@override_settings(
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'LoginRequiredMiddleware' not in m],
+    APPEND_SLASH=False
+)
+class CompressionTests(TestCase):
+    """Dynamic text responses are compressed when worth it, with BREACH padding when a CSRF token is present"""
+
+    def setUp(self):
+        cache.clear()
+        compression_stats.reset()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='password')
+        self.client.force_login(self.admin)
+        room = Room.objects.create(number='Z-101', room_type='single', price=5000, capacity=50)
+        for i in range(30):
+            Guest.objects.create(first_name=f'Guest{i}', last_name='Compressible', email=f'g{i}@test.com', room=room)
+
+    def test_gzip_json_and_conditional_get(self):
+        response = self.client.get(reverse('get_guests'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['guests']), 30)
+        self.assertLess(compression_stats.snapshot()['gzip']['ratio'], 0.5)
+
+        # The ETag is weakened but still matches
+        self.assertTrue(response['ETag'].startswith('W/'))
+        again = self.client.get(reverse('get_guests'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_skipped_responses(self):
+        for encoding in ('', 'gzip;q=0', 'identity'):
+            response = self.client.get(reverse('get_guests'), HTTP_ACCEPT_ENCODING=encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), encoding)
+        # Below the size threshold
+        self.assertFalse(self.client.get(reverse('health_check'), HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        # Not on the content-type allowlist
+        middleware = CompressionMiddleware(lambda request: HttpResponse(b'\x89PNG' * 1000, content_type='image/png'))
+        self.assertFalse(middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding'))
+
+    def test_brotli_unless_a_csrf_token_was_rendered(self):
+        fake_brotli = SimpleNamespace(compress=lambda data, quality: b'br')
+        with mock.patch('hotel_project.middleware.brotli', fake_brotli):
+            api = self.client.get(reverse('get_guests'), HTTP_ACCEPT_ENCODING='gzip, br')
+            page = self.client.get(reverse('manage_guests'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(api['Content-Encoding'], 'br')
+        self.assertEqual(page['Content-Encoding'], 'gzip')
+        self.assertIn(b'csrfmiddlewaretoken', gzip.decompress(page.content))
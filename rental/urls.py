@@ -5,6 +5,7 @@ from .performance_views import (
     record_payment_from_dashboard,
     record_bill_payment_from_dashboard,
     record_maintenance,
+    occupancy_calendar,
 )
 
 urlpatterns = [
@@ -19,13 +20,16 @@ urlpatterns = [
     path('manage-payments/', views.manage_payments, name='manage_payments'),
     path('manage-electricity-bills/', views.manage_electricity_bills, name='manage_electricity_bills'),
     path('performance-dashboard/', performance_dashboard, name='performance_dashboard'),
+    path('api/occupancy/calendar/', occupancy_calendar, name='occupancy_calendar'),
     path('api/guests/', views.get_guests, name='get_guests'),
+    path('api/sync/', views.sync_changes, name='sync_changes'),
     path('api/guest/add/', views.add_guest, name='add_guest'),
     path('api/guest/<int:guest_id>/update/', views.update_guest, name='update_guest'),
     path('api/guest/<int:guest_id>/checkout/', views.checkout_guest, name='checkout_guest'),
     path('api/guest/<int:guest_id>/delete/', views.delete_guest, name='delete_guest'),
     # Restore original and add new
     path('api/available-rooms/', views.get_available_rooms, name='get_available_rooms'),
+    path('api/availability/', views.get_availability, name='get_availability'),
     path('api/submit-booking/', views.submit_booking, name='submit_booking'),
     path('api/room/<int:room_id>/update/', views.update_room, name='update_room'),
     path('api/room/add/', views.add_room, name='add_room'),
@@ -33,6 +37,7 @@ urlpatterns = [
     path('api/room/<int:room_id>/details/', views.get_room_details, name='get_room_details'),
     path('api/payment/create-monthly/', views.create_monthly_payment, name='create_monthly_payment'),
     path('api/payment/record/', views.record_payment, name='record_payment'),
+    path('api/payment/record-batch/', views.record_payment_batch, name='record_payment_batch'),
     path('api/payment/record-from-dashboard/', record_payment_from_dashboard, name='record_payment_dashboard'),
     path('api/payment/record-bill-from-dashboard/', record_bill_payment_from_dashboard, name='record_bill_payment_dashboard'),
     path('api/maintenance/record/', record_maintenance, name='record_maintenance'),
@@ -1,17 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.contrib.auth.models import User
 from django.db import transaction
-from django.db.models import Sum, Q, Avg
-from .models import Room, Booking, Guest, MonthlyPayment, PaymentRecord, ElectricityBill
+from django.db.models import Sum, Q, Avg, Prefetch, Count, F, Value, DecimalField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.paginator import Paginator
+from .models import Room, Booking, Guest, MonthlyPayment, PaymentRecord, ElectricityBill, building_label, building_sort_key
+from .availability import AVAILABILITY_MAX_DAYS, free_slots
+from .billing import bill_stay
+from .rollups import refresh_room_collections, refresh_building_collections, payment_status_totals
+from .occupancy import RoomFullError, assign_room, refresh_occupancy
+from .cache import cached, generation_etag, BOOKINGS, ELECTRICITY, GUESTS, PAYMENTS, ROOMS
+from .sync import changes_since, decode_token
+from .idempotency import idempotent
+from .payments import PaymentError, post_electricity_payment, post_rent_payment, post_rent_payments
 from collections import defaultdict
-from datetime import datetime
-from decimal import Decimal
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+import base64
 import json
+from urllib.parse import urlencode
 
 import logging
 import re
@@ -76,79 +88,41 @@ def logout_view(request):
     logout(request)
     return redirect('home')
 
+def _rooms_by_building(rooms):
+    # Rooms keep their order within a building; buildings come out M1, 1, 2, ..., 10, ...
+    buildings = defaultdict(list)
+    for room in rooms:
+        buildings[room.building].append(room)
+    return sorted(buildings.items(), key=lambda item: building_sort_key(item[0]))
+
+def _dashboard_summary():
+    # Rooms come with occupancy_status annotated and current_tenants prefetched
+    rooms = list(Room.objects.with_occupancy(tenants=True))
+    bookings = Booking.objects.all()
+
+    # Calculate active stats
+    total_rooms = len(rooms)
+    active_rooms_count = sum(1 for room in rooms if not room.is_available)
+    occupancy_rate = (active_rooms_count / total_rooms * 100) if total_rooms > 0 else 0
+
+    return {
+        'total_rooms': total_rooms,
+        'available_rooms': total_rooms - active_rooms_count,
+        'booked_rooms': active_rooms_count,
+        'active_rooms_count': active_rooms_count,
+        'occupancy_rate': round(occupancy_rate, 1),
+        'active_bookings': bookings.filter(is_active=True).count(),
+        'total_bookings': bookings.count(),
+        'all_bookings': list(bookings[:5]),
+        'total_guests': Guest.objects.filter(is_active=True).count(),
+        'buildings': _rooms_by_building(rooms),
+    }
+
 @login_required(login_url='login')
 def dashboard(request):
     try:
-        rooms = Room.objects.all()
-        bookings = Booking.objects.all()
-        guests = Guest.objects.filter(is_active=True)
-        
-        # Fetch all active guests and map them to rooms
-        active_guests = Guest.objects.filter(is_active=True).select_related('room')
-        room_tenants = defaultdict(list)
-        for guest in active_guests:
-            if guest.room:
-                room_tenants[guest.room.id].append(guest)
-                
-        
-        # Enrich rooms with tenant data and calculate status
-        for room in rooms:
-            tenants = room_tenants.get(room.id, [])
-            room.current_tenants = tenants
-            
-            # Determine Capacity
-            # Use database capacity and model properties
-            count = len(tenants)
-            if count == 0:
-                room.occupancy_status = 'empty'
-            elif count < room.capacity:
-                room.occupancy_status = 'partial'
-            else:
-                room.occupancy_status = 'full'
-                
-        # Group rooms by building
-        buildings = defaultdict(list)
-        for room in rooms:
-            building_name = room.number.split('-')[0]
-            buildings[building_name].append(room)
-        
-        # Sort buildings
-        sorted_buildings = sorted(buildings.items())
-        
-        # Map building names: A -> M1, B -> 1, C -> 2, D -> 3, etc.
-        def map_building_name(original_name):
-            if original_name == 'A':
-                return 'M1'
-            elif original_name == 'M1': # Handle direct naming if changed in db
-                return 'M1'
-            else:
-                try:
-                    # Convert B->1, C->2, D->3, etc.
-                    val = ord(original_name) - ord('B') + 1
-                    return str(val) if val > 0 else original_name
-                except:
-                    return original_name
-        
-        # Apply mapping to building names
-        mapped_buildings = [(map_building_name(name), rooms) for name, rooms in sorted_buildings]
-        
-        # Calculate active stats
-        active_rooms_count = rooms.filter(is_available=False).count()
-        occupancy_rate = (active_rooms_count / rooms.count() * 100) if rooms.count() > 0 else 0
-        
-        context = {
-            'total_rooms': rooms.count(),
-            'available_rooms': rooms.filter(is_available=True).count(),
-            'booked_rooms': active_rooms_count,
-            'active_rooms_count': active_rooms_count,
-            'occupancy_rate': round(occupancy_rate, 1),
-            'active_bookings': bookings.filter(is_active=True).count(),
-            'total_bookings': bookings.count(),
-            'all_bookings': bookings[:5],
-            'total_guests': guests.count(),
-            'buildings': mapped_buildings,
-            'is_admin': request.user.is_staff or request.user.is_superuser,
-        }
+        context = dict(cached('dashboard', (ROOMS, GUESTS, BOOKINGS), _dashboard_summary))
+        context['is_admin'] = request.user.is_staff or request.user.is_superuser
         
         return render(request, 'dashboard.html', context)
     except Exception as e:
@@ -158,26 +132,10 @@ def dashboard(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def manage_buildings(request):
-    rooms = Room.objects.all().order_by('number')
-    
-    # Group rooms by building
-    buildings = defaultdict(list)
-    for room in rooms:
-        building_name = room.number.split('-')[0]
-        buildings[building_name].append(room)
-    
-    sorted_buildings = sorted(buildings.items())
-    
-    # Map building names: A -> M1, B -> 1, C -> 2, D -> 3, etc.
-    def map_building_name(original_name):
-        if original_name == 'A':
-            return 'M1'
-        else:
-            # Convert B->1, C->2, D->3, etc.
-            return str(ord(original_name) - ord('B') + 1)
-    
-    # Apply mapping to building names
-    mapped_buildings = [(map_building_name(name), rooms) for name, rooms in sorted_buildings]
+    mapped_buildings = cached(
+        'manage_buildings', (ROOMS,),
+        lambda: _rooms_by_building(Room.objects.with_occupancy().order_by('number')),
+    )
     
     context = {
         'buildings': mapped_buildings,
@@ -190,8 +148,8 @@ def manage_buildings(request):
 @user_passes_test(is_admin)
 def manage_guests(request):
     """Manage guest information with structured data"""
-    guests = Guest.objects.all().order_by('-created_at')
-    rooms = Room.objects.all().order_by('number')
+    guests = Guest.objects.select_related('room').order_by('-created_at')
+    rooms = Room.objects.with_occupancy().order_by('number')
     
     # Get guest statistics
     guest_stats = {
@@ -202,31 +160,14 @@ def manage_guests(request):
         'without_room': guests.filter(room__isnull=True).count(),
     }
     
-    # Generate dynamic building list from existing rooms
-    building_prefixes = set()
-    building_map = {
-        'A': 'M1 Complex',
-        'B': 'Building 1',
-        'C': 'Building 2',
-        'D': 'Building 3',
-        'E': 'Building 4',
-        'F': 'Building 5',
-    }
-    
-    for room in rooms:
-        prefix = room.number.split('-')[0] if '-' in room.number else room.number[0]
-        building_prefixes.add(prefix)
-    
-    # Sort and convert to list with display names
-    buildings = sorted([
-        {'prefix': prefix, 'name': building_map.get(prefix, f'Building {prefix}')}
-        for prefix in building_prefixes
-    ], key=lambda x: x['prefix'])
+    # Generate dynamic building list from existing rooms, in room number order
+    building_codes = list(dict.fromkeys(room.building for room in rooms))
+    buildings = [{'prefix': code, 'name': building_label(code)} for code in building_codes]
     
     context = {
         'guests': guests,
         'rooms': rooms,
-        'available_rooms': [r for r in rooms if r.effective_availability or r.guest_set.filter(is_active=True).exists()], # Include partially filled
+        'available_rooms': [r for r in rooms if r.is_bookable or r.occupancy > 0], # Include partially filled
         'guest_stats': guest_stats,
         'buildings': buildings,  # Dynamic building list for filters
     }
@@ -259,7 +200,11 @@ def update_room(request, room_id):
             except ValueError:
                 pass
         room.is_available = request.POST.get('is_available') == 'true'
-        room.save()
+        with transaction.atomic():
+            room.save()
+            if new_number:
+                # Building may have changed with the number; move the rollups along
+                refresh_room_collections(room.id)
         
         return JsonResponse({
             'success': True,
@@ -283,6 +228,7 @@ def update_room(request, room_id):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def add_room(request):
     try:
         room_number = request.POST.get('room_number')
@@ -338,7 +284,10 @@ def delete_room(request, room_id):
     try:
         room = get_object_or_404(Room, id=room_id)
         room_number = room.number
-        room.delete()
+        with transaction.atomic():
+            billed_months = list(room.monthly_payments.values_list('month', flat=True))
+            room.delete()
+            refresh_building_collections((room.building, m) for m in billed_months)
         
         return JsonResponse({
             'success': True,
@@ -353,6 +302,7 @@ def delete_room(request, room_id):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def add_guest(request):
     try:
         # Validate file size and type before processing
@@ -399,52 +349,52 @@ def add_guest(request):
         # Get room and agreed_rent
         room_id = request.POST.get('room_id') or None
         if room_id:
-            room = get_object_or_404(Room, id=room_id)
-            if room.is_full:
-                 return JsonResponse({
-                    'success': False,
-                    'message': f'Room {room.number} is already full ({room.capacity}/{room.capacity})'
-                }, status=400)
+            get_object_or_404(Room, id=room_id)
 
         agreed_rent_str = request.POST.get('agreed_rent', '').strip()
         
-        guest = Guest.objects.create(
-            first_name=first_name,
-            last_name=last_name,
-            email=request.POST.get('email', '').strip(),
-            phone=request.POST.get('phone', '').strip(),
-            gender=request.POST.get('gender', 'M'),
-            date_of_birth=parse_date(dob),
-            address=request.POST.get('address', ''),
-            city=request.POST.get('city', ''),
-            state=request.POST.get('state', ''),
-            country=request.POST.get('country', ''),
-            zip_code=request.POST.get('zip_code', ''),
-            id_type=request.POST.get('id_type', ''),
-            id_number=request.POST.get('id_number', ''),
-            college_id=request.POST.get('college_id', ''),
-            student_college=request.POST.get('student_college', ''),
-            check_in_date=parse_date(check_in),
-            check_out_date=parse_date(check_out),
-            room_id=room_id,
-            notes=request.POST.get('notes', ''),
-        )
+        with transaction.atomic():
+            guest = Guest(
+                first_name=first_name,
+                last_name=last_name,
+                email=request.POST.get('email', '').strip(),
+                phone=request.POST.get('phone', '').strip(),
+                gender=request.POST.get('gender', 'M'),
+                date_of_birth=parse_date(dob),
+                address=request.POST.get('address', ''),
+                city=request.POST.get('city', ''),
+                state=request.POST.get('state', ''),
+                country=request.POST.get('country', ''),
+                zip_code=request.POST.get('zip_code', ''),
+                id_type=request.POST.get('id_type', ''),
+                id_number=request.POST.get('id_number', ''),
+                college_id=request.POST.get('college_id', ''),
+                student_college=request.POST.get('student_college', ''),
+                check_in_date=parse_date(check_in),
+                check_out_date=parse_date(check_out),
+                notes=request.POST.get('notes', ''),
+            )
+            # Locks the room until commit so two staff can't both take its last slot
+            assign_room(guest, room_id)
+            guest.save()
         
-        # Room status update and agreed_rent handling
-        if guest.room:
-            # Mark as not available only if it reached capacity
-            if guest.room.is_full:
-                guest.room.is_available = False
+            # Room status update and agreed_rent handling
+            if guest.room:
+                refresh_occupancy(guest.room_id)
+                guest.room.refresh_from_db(fields=['occupancy'])
+                # Mark as not available only if it reached capacity
+                if guest.room.is_full:
+                    guest.room.is_available = False
             
-            # Set agreed_rent on the room if provided (default ₹7000)
-            if agreed_rent_str:
-                try:
-                    guest.room.agreed_rent = float(agreed_rent_str)
-                except ValueError:
-                    guest.room.agreed_rent = 7000  # Default
-            elif not guest.room.agreed_rent:
-                guest.room.agreed_rent = 7000  # Default if not set
-            guest.room.save()
+                # Set agreed_rent on the room if provided (default ₹7000)
+                if agreed_rent_str:
+                    try:
+                        guest.room.agreed_rent = float(agreed_rent_str)
+                    except ValueError:
+                        guest.room.agreed_rent = 7000  # Default
+                elif not guest.room.agreed_rent:
+                    guest.room.agreed_rent = 7000  # Default if not set
+                guest.room.save()
 
         if 'govt_id_photo' in request.FILES:
             guest.govt_id_photo = request.FILES['govt_id_photo']
@@ -577,6 +527,8 @@ def update_guest(request, guest_id):
         
         # Use transaction to ensure atomicity
         with transaction.atomic():
+            old_room_id = guest.room_id
+            
             # Handle Room Change
             if guest.room_id != new_room_id:
                 # Free old room
@@ -584,24 +536,14 @@ def update_guest(request, guest_id):
                 if old_room:
                     # After this guest leaves, the room will definitely have a free slot
                     old_room.is_available = True
-                    old_room.save()
+                    old_room.save(update_fields=['is_available'])
                 
-                # Occupy new room
-                if new_room_id:
-                    new_room = Room.objects.get(id=new_room_id)
-                    # We check if NEW room is full (excluding the guest themselves if they were already there, 
-                    # but here guest.room_id != new_room_id so they weren't)
-                    if new_room.is_full:
-                         return JsonResponse({
-                            'success': False,
-                            'message': f'Room {new_room.number} is already full ({new_room.capacity}/{new_room.capacity})'
-                        }, status=400)
-                    
+                # Occupy new room; the row stays locked until commit
+                new_room = assign_room(guest, new_room_id)
+                if new_room and new_room.current_occupancy + 1 >= new_room.capacity:
                     # Update new room status if it becomes full after this guest joins
-                    # Note: guest.room_id = new_room_id happens below, so for now current_occupancy doesn't include them
-                    if new_room.current_occupancy + 1 >= new_room.capacity:
-                        new_room.is_available = False
-                        new_room.save()
+                    new_room.is_available = False
+                    new_room.save(update_fields=['is_available'])
             
             # Apply updates
             guest.first_name = updates['first_name'] or guest.first_name
@@ -621,7 +563,6 @@ def update_guest(request, guest_id):
             guest.zip_code = updates['zip_code']
             guest.check_in_date = updates['check_in_date']
             guest.check_out_date = updates['check_out_date']
-            guest.room_id = new_room_id
             guest.notes = updates['notes']
             
             # Update images only if provided
@@ -635,6 +576,7 @@ def update_guest(request, guest_id):
             # Mark as updated
             guest.updated_at = datetime.now()
             guest.save()
+            refresh_occupancy(old_room_id, guest.room_id)
             
             # Audit logging
             logger.info(f"AUDIT - User: {request.user.username} - Updated Guest: {guest.id} ({guest.full_name})")
@@ -652,6 +594,11 @@ def update_guest(request, guest_id):
                 'check_out': guest.check_out_date.strftime('%Y-%m-%d') if guest.check_out_date else None,
             }
         })
+    except RoomFullError as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
     except ValueError as ve:
         return JsonResponse({
             'success': False,
@@ -684,8 +631,9 @@ def checkout_guest(request, guest_id):
             
             if room:
                 # Once a guest checks out, the room is definitely not full anymore
+                refresh_occupancy(room.id)
                 room.is_available = True
-                room.save()
+                room.save(update_fields=['is_available'])
                 
         return JsonResponse({
             'success': True,
@@ -702,14 +650,18 @@ def delete_guest(request, guest_id):
         guest = get_object_or_404(Guest, id=guest_id)
         name = guest.full_name
         
-        # Free room and archive
-        if guest.room:
-            guest.room.is_available = True
-            guest.room.save()
-            guest.room = None # Remove room assignment
-            
-        guest.is_active = False
-        guest.save()
+        room_id = guest.room_id
+        
+        with transaction.atomic():
+            # Free room and archive
+            if guest.room:
+                guest.room.is_available = True
+                guest.room.save(update_fields=['is_available'])
+                guest.room = None # Remove room assignment
+                
+            guest.is_active = False
+            guest.save()
+            refresh_occupancy(room_id)
         
         return JsonResponse({
             'success': True,
@@ -721,62 +673,171 @@ def delete_guest(request, guest_id):
             'message': str(e)
         }, status=400)
 
+# Public field name -> the .values() lookups it is built from
+GUEST_API_FIELDS = {
+    'id': ('id',),
+    'first_name': ('first_name',),
+    'last_name': ('last_name',),
+    'full_name': ('first_name', 'last_name'),
+    'email': ('email',),
+    'phone': ('phone',),
+    'gender': ('gender',),
+    'date_of_birth': ('date_of_birth',),
+    'address': ('address',),
+    'city': ('city',),
+    'state': ('state',),
+    'country': ('country',),
+    'zip_code': ('zip_code',),
+    'id_type': ('id_type',),
+    'id_number': ('id_number',),
+    'college_id': ('college_id',),
+    'student_college': ('student_college',),
+    'check_in_date': ('check_in_date',),
+    'check_out_date': ('check_out_date',),
+    'notes': ('notes',),
+    'is_active': ('is_active',),
+    'created_at': ('created_at',),
+    'room': ('room_id', 'room__number', 'room__price', 'room__agreed_rent'),
+    'govt_id_photo': ('govt_id_photo',),
+    'college_id_photo': ('college_id_photo',),
+}
+GUEST_API_PAGE_SIZE = 50
+GUEST_API_MAX_PAGE_SIZE = 200
+PAYMENT_HISTORY_LIMIT = 24
+PAYMENT_HISTORY_MAX_LIMIT = 120
+ELECTRICITY_BILLS_PER_PAGE = 50
+PAYMENT_BATCH_MAX_ITEMS = 200
+
+
+def _encode_guest_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_guest_cursor(token):
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    created_at, guest_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(created_at), int(guest_id)
+
+
+def _guest_field(name, row):
+    if name == 'full_name':
+        return f"{row['first_name']} {row['last_name']}"
+    if name == 'room':
+        if row['room_id'] is None:
+            return None
+        return {
+            'id': row['room_id'],
+            'number': row['room__number'],
+            'price': str(row['room__price']),
+            'agreed_rent': str(row['room__agreed_rent']) if row['room__agreed_rent'] is not None else None,
+        }
+    if name in ('govt_id_photo', 'college_id_photo'):
+        return Guest._meta.get_field(name).storage.url(row[name]) if row[name] else None
+    if name == 'date_of_birth':
+        return row[name].strftime('%Y-%m-%d') if row[name] else None
+    if name in ('check_in_date', 'check_out_date'):
+        return row[name].strftime('%Y-%m-%d') if row[name] else ''
+    if name == 'created_at':
+        return row[name].isoformat() if row[name] else None
+    return row[name]
+
+
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(GUESTS, ROOMS))
 def get_guests(request):
+    """
+    Guests, newest first, one page at a time.
+
+    Query parameters:
+        limit          page size (default 50, max 200)
+        cursor         next_cursor from the previous page
+        fields         comma-separated subset of GUEST_API_FIELDS
+        active         true (default), false or all; archived=true is kept as an alias for all
+        building       building code, e.g. M1 or 2
+        room           room id
+        check_in_from  YYYY-MM-DD, inclusive
+        check_in_to    YYYY-MM-DD, inclusive
+    """
     try:
+        fields = [f.strip() for f in request.GET.get('fields', '').split(',') if f.strip()] or list(GUEST_API_FIELDS)
+        unknown = [f for f in fields if f not in GUEST_API_FIELDS]
+        if unknown:
+            return JsonResponse({'success': False, 'message': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+
+        try:
+            limit = min(max(int(request.GET.get('limit', GUEST_API_PAGE_SIZE)), 1), GUEST_API_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'limit must be a number'}, status=400)
+
+        guests = Guest.objects.all()
+
         # Default to showing active guests unless specified
-        show_archived = request.GET.get('archived') == 'true'
-        if show_archived:
-            guests = Guest.objects.all().select_related('room').order_by('-created_at')
-        else:
-            guests = Guest.objects.filter(is_active=True).select_related('room').order_by('-created_at')
-            
-        guests_data = []
-        
-        for g in guests:
-            guests_data.append({
-                'id': g.id,
-                'first_name': g.first_name,
-                'last_name': g.last_name,
-                'full_name': g.full_name,
-                'email': g.email,
-                'phone': g.phone,
-                'gender': g.gender,
-                'date_of_birth': g.date_of_birth.strftime('%Y-%m-%d') if g.date_of_birth else None,
-                'address': g.address,
-                'city': g.city,
-                'state': g.state,
-                'country': g.country,
-                'zip_code': g.zip_code,
-                'id_type': g.id_type,
-                'id_number': g.id_number,
-                'college_id': g.college_id,
-                'student_college': g.student_college,
-                'check_in_date': g.check_in_date.strftime('%Y-%m-%d') if g.check_in_date else '',
-                'check_out_date': g.check_out_date.strftime('%Y-%m-%d') if g.check_out_date else '',
-                'notes': g.notes,
-                'is_active': g.is_active,
-                'created_at': g.created_at.isoformat() if g.created_at else None,
-                'room': {
-                    'id': g.room.id,
-                    'number': g.room.number,
-                    'price': str(g.room.price),
-                    'agreed_rent': str(g.room.agreed_rent) if g.room.agreed_rent is not None else None
-                } if g.room else None,
-                'govt_id_photo': g.govt_id_photo.url if g.govt_id_photo else None,
-                'college_id_photo': g.college_id_photo.url if g.college_id_photo else None,
-            })
-        
+        active = request.GET.get('active', 'all' if request.GET.get('archived') == 'true' else 'true')
+        if active == 'true':
+            guests = guests.filter(is_active=True)
+        elif active == 'false':
+            guests = guests.filter(is_active=False)
+        elif active != 'all':
+            return JsonResponse({'success': False, 'message': 'active must be true, false or all'}, status=400)
+
+        if request.GET.get('building'):
+            guests = guests.filter(room__building=request.GET['building'])
+        if request.GET.get('room'):
+            guests = guests.filter(room_id=request.GET['room'])
+        try:
+            if request.GET.get('check_in_from'):
+                guests = guests.filter(check_in_date__gte=datetime.strptime(request.GET['check_in_from'], '%Y-%m-%d').date())
+            if request.GET.get('check_in_to'):
+                guests = guests.filter(check_in_date__lte=datetime.strptime(request.GET['check_in_to'], '%Y-%m-%d').date())
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
+
+        if request.GET.get('cursor'):
+            try:
+                created_at, guest_id = _decode_guest_cursor(request.GET['cursor'])
+            except (ValueError, UnicodeDecodeError):
+                return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+            guests = guests.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=guest_id))
+
+        lookups = {'id', 'created_at'}
+        for name in fields:
+            lookups.update(GUEST_API_FIELDS[name])
+        rows = list(guests.order_by('-created_at', '-id').values(*lookups)[:limit + 1])
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_guest_cursor(rows[-1])
+
         return JsonResponse({
             'success': True,
-            'guests': guests_data,
-            'guest_list': guests_data # For compatibility
+            'guests': [{name: _guest_field(name, row) for name in fields} for row in rows],
+            'next_cursor': next_cursor,
         })
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=400)
 
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def sync_changes(request):
+    """
+    Rooms, guests, payments and electricity bills changed since ?since=<token>.
+
+    Start without `since` to get a token; keep passing the token from the last
+    response. `reset` means the token was missing or too old and the page
+    should reload. Deleted rows are listed by id under `deleted`.
+    """
+    since = request.GET.get('since')
+    try:
+        since = decode_token(since) if since else None
+    except (ValueError, OverflowError):
+        return JsonResponse({'success': False, 'message': 'Invalid sync token'}, status=400)
+    return JsonResponse({'success': True, **changes_since(since)})
+
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def manage_users(request):
@@ -801,6 +862,7 @@ def manage_users(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def add_user(request):
     """API to create a new staff user"""
     try:
@@ -864,17 +926,13 @@ def manage_payments(request):
     rooms = Room.objects.all().order_by('number')
     payments = MonthlyPayment.objects.select_related('room', 'guest').order_by('-month')
     monthly_payments = MonthlyPayment.objects.select_related('room', 'guest').filter(
-        payment_status__in=['pending', 'partial']
-    ).order_by('-month')
+        payment_status__in=['pending', 'partial', 'overdue']
+    ).order_by('-month').prefetch_related(
+        Prefetch('payment_records', queryset=PaymentRecord.objects.order_by('-payment_date'))
+    )
     
-    # Get payment status summary
-    payment_stats = {
-        'pending': payments.filter(payment_status='pending').count(),
-        'partial': payments.filter(payment_status='partial').count(),
-        'paid': payments.filter(payment_status='paid').count(),
-        'overdue': payments.filter(payment_status='overdue').count(),
-        'total_pending_amount': sum(p.remaining_amount() for p in payments.filter(payment_status__in=['pending', 'partial', 'overdue'])),
-    }
+    # Status counts and pending total in one aggregate over the pre-summed building rollups
+    payment_stats = payment_status_totals()
     
     context = {
         'rooms': rooms,
@@ -888,22 +946,56 @@ def manage_payments(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def manage_electricity_bills(request):
-    """Electricity bill tracking and management"""
-    rooms = Room.objects.all().order_by('number')
-    bills = ElectricityBill.objects.select_related('room', 'guest').order_by('-month')
-    
-    # Get bill status summary
-    bill_stats = {
-        'pending': bills.filter(bill_status='pending').count(),
-        'paid': bills.filter(bill_status='paid').count(),
-        'overdue': bills.filter(bill_status='overdue').count(),
-        'total_pending_amount': sum(b.remaining_amount() for b in bills.filter(bill_status__in=['pending', 'overdue'])),
+    """Electricity bill tracking and management, filtered by month/building/status and paginated"""
+    bills = ElectricityBill.objects.all()
+    filters = {
+        'month': request.GET.get('month', ''),
+        'building': request.GET.get('building', ''),
+        'status': request.GET.get('status', ''),
     }
+    if filters['month']:
+        try:
+            bills = bills.filter(month=datetime.strptime(filters['month'], '%Y-%m').date())
+        except ValueError:
+            filters['month'] = ''
+    if filters['building']:
+        bills = bills.filter(room__building=filters['building'])
+    if filters['status'] in dict(ElectricityBill.BILL_STATUS_CHOICES):
+        bills = bills.filter(bill_status=filters['status'])
+    else:
+        filters['status'] = ''
+    
+    # Get bill status summary for the filtered bills in one aggregate
+    outstanding = Q(bill_status__in=['pending', 'overdue'])
+    bill_stats = bills.aggregate(
+        pending=Count('id', filter=Q(bill_status='pending')),
+        paid=Count('id', filter=Q(bill_status='paid')),
+        overdue=Count('id', filter=Q(bill_status='overdue')),
+        total_pending_amount=Coalesce(
+            Sum(F('bill_amount') - F('paid_amount'), filter=outstanding), Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    
+    page = Paginator(
+        bills.select_related('room', 'guest').order_by('-month', 'room__number'), ELECTRICITY_BILLS_PER_PAGE
+    ).get_page(request.GET.get('page'))
+    
+    # Last meter reading per room pre-fills the new-bill form
+    last_reading = ElectricityBill.objects.filter(room=OuterRef('pk')).order_by('-month').values('ending_reading')[:1]
+    rooms = Room.objects.annotate(last_reading=Subquery(last_reading)).order_by('number')
     
     context = {
         'rooms': rooms,
-        'bills': bills[:100],
+        'bills': page,
         'bill_stats': bill_stats,
+        'filters': filters,
+        'filter_query': urlencode({k: v for k, v in filters.items() if v}),
+        'buildings': [
+            (code, building_label(code))
+            for code in Room.objects.order_by('building').values_list('building', flat=True).distinct()
+        ],
+        'status_choices': ElectricityBill.BILL_STATUS_CHOICES,
     }
     
     return render(request, 'manage_electricity_bills.html', context)
@@ -911,6 +1003,7 @@ def manage_electricity_bills(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def create_monthly_payment(request):
     """Create monthly payment record for a room"""
     try:
@@ -957,15 +1050,17 @@ def create_monthly_payment(request):
         except ValueError as e:
             return JsonResponse({'success': False, 'message': f'Error parsing month: {str(e)}'}, status=400)
         
-        payment, created = MonthlyPayment.objects.get_or_create(
-            room=room,
-            month=month,
-            defaults={'rent_amount': rent_amount}
-        )
-        
-        if not created:
-            payment.rent_amount = rent_amount
-            payment.save()
+        with transaction.atomic():
+            payment, created = MonthlyPayment.objects.get_or_create(
+                room=room,
+                month=month,
+                defaults={'rent_amount': rent_amount}
+            )
+            
+            if not created:
+                payment.rent_amount = rent_amount
+                payment.save()
+            refresh_room_collections(room.id, [month])
         
         return JsonResponse({
             'success': True,
@@ -990,6 +1085,7 @@ def create_monthly_payment(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def record_payment(request):
     """Record a payment against monthly rent"""
     try:
@@ -999,10 +1095,10 @@ def record_payment(request):
         
         # Validate and parse amount
         try:
-            payment_amount = float(request.POST.get('payment_amount', 0))
+            payment_amount = Decimal(request.POST.get('payment_amount', '0'))
             if payment_amount <= 0:
                 return JsonResponse({'success': False, 'message': 'Payment amount must be greater than 0'}, status=400)
-        except ValueError:
+        except InvalidOperation:
             return JsonResponse({'success': False, 'message': 'Invalid payment amount'}, status=400)
         
         # Validate and parse date
@@ -1020,29 +1116,11 @@ def record_payment(request):
         reference = request.POST.get('reference_number', '').strip()
         notes = request.POST.get('notes', '').strip()
         
-        monthly_payment = get_object_or_404(MonthlyPayment, id=payment_id)
-        
-        # Create payment record
-        record = PaymentRecord.objects.create(
-            monthly_payment=monthly_payment,
-            payment_date=payment_date,
-            payment_amount=payment_amount,
-            payment_method=payment_method,
-            reference_number=reference,
-            notes=notes,
-            created_by=request.user
+        monthly_payment, record = post_rent_payment(
+            payment_id, payment_amount, payment_date,
+            method=payment_method, reference=reference, notes=notes, user=request.user,
         )
         
-        # Update monthly payment
-        monthly_payment.paid_amount += payment_amount
-        if monthly_payment.paid_amount >= monthly_payment.rent_amount:
-            monthly_payment.payment_status = 'paid'
-            monthly_payment.paid_date = payment_date
-        elif monthly_payment.paid_amount > 0:
-            monthly_payment.payment_status = 'partial'
-        
-        monthly_payment.save()
-        
         return JsonResponse({
             'success': True,
             'message': f'Payment of ₹{payment_amount:.2f} recorded successfully on {payment_date.strftime("%d-%m-%Y")}',
@@ -1055,6 +1133,8 @@ def record_payment(request):
         })
     except MonthlyPayment.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Payment record not found'}, status=404)
+    except PaymentError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -1063,9 +1143,95 @@ def record_payment(request):
             'message': f'Error recording payment: {str(e)}'
         }, status=400)
 
+def _parse_batch_payment(item):
+    """Validate one record-batch item into a post_rent_payments() posting. Raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('Each payment must be an object')
+    try:
+        payment_id = int(item.get('payment_id'))
+    except (TypeError, ValueError):
+        raise ValueError('Payment ID is required')
+    try:
+        amount = Decimal(str(item.get('payment_amount')))
+    except InvalidOperation:
+        raise ValueError('Invalid payment amount')
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError('Payment amount must be greater than 0')
+    try:
+        payment_date = datetime.strptime(str(item.get('payment_date')), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Invalid date format. Please use YYYY-MM-DD format')
+    method = item.get('payment_method') or 'cash'
+    if method not in dict(PaymentRecord._meta.get_field('payment_method').choices):
+        raise ValueError(f'Unknown payment method: {method}')
+    return {
+        'monthly_payment_id': payment_id,
+        'amount': amount,
+        'payment_date': payment_date,
+        'method': method,
+        'reference': str(item.get('reference_number') or '').strip(),
+        'notes': str(item.get('notes') or '').strip(),
+    }
+
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
+def record_payment_batch(request):
+    """
+    Record many rent payments in one request.
+
+    Body: a JSON array of {"payment_id", "payment_amount", "payment_date" (YYYY-MM-DD),
+    "payment_method", "reference_number", "notes"}. Every item is validated;
+    valid items are posted together in one transaction and the response carries
+    one result per item, in order.
+    """
+    try:
+        items = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'message': 'Body must be a JSON array of payments'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'success': False, 'message': 'Body must be a non-empty JSON array of payments'}, status=400)
+    if len(items) > PAYMENT_BATCH_MAX_ITEMS:
+        return JsonResponse({'success': False, 'message': f'At most {PAYMENT_BATCH_MAX_ITEMS} payments per batch'}, status=400)
+
+    results = [None] * len(items)
+    postings, positions = [], []
+    for index, item in enumerate(items):
+        try:
+            postings.append(_parse_batch_payment(item))
+            positions.append(index)
+        except ValueError as e:
+            results[index] = {'index': index, 'success': False, 'message': str(e)}
+
+    if postings:
+        for index, record in zip(positions, post_rent_payments(postings, user=request.user)):
+            if record is None:
+                results[index] = {'index': index, 'success': False, 'message': 'Payment record not found'}
+                continue
+            payment = record.monthly_payment
+            results[index] = {
+                'index': index,
+                'success': True,
+                'payment_record_id': record.id,
+                'payment': {
+                    'id': payment.id,
+                    'paid_amount': str(payment.paid_amount),
+                    'status': payment.payment_status,
+                    'remaining': str(payment.remaining_amount()),
+                },
+            }
+
+    return JsonResponse({
+        'success': True,
+        'posted': sum(1 for r in results if r['success']),
+        'results': results,
+    })
+
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_http_methods(["POST"])
+@idempotent
 def create_electricity_bill(request):
     """Create electricity bill for a room"""
     try:
@@ -1168,21 +1334,25 @@ def create_electricity_bill(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def record_electricity_payment(request):
     """Record electricity bill payment"""
     try:
         bill_id = request.POST.get('bill_id')
-        paid_amount = float(request.POST.get('paid_amount', 0))
-        paid_date = request.POST.get('paid_date')
-        
-        bill = get_object_or_404(ElectricityBill, id=bill_id)
-        bill.paid_amount += paid_amount
-        
-        if bill.paid_amount >= bill.bill_amount:
-            bill.bill_status = 'paid'
-            bill.paid_date = paid_date
+        try:
+            paid_amount = Decimal(request.POST.get('paid_amount', '0'))
+        except InvalidOperation:
+            return JsonResponse({'success': False, 'message': 'Invalid payment amount'}, status=400)
+        paid_date_str = request.POST.get('paid_date')
+        try:
+            paid_date = datetime.strptime(paid_date_str, '%Y-%m-%d').date() if paid_date_str else date.today()
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
         
-        bill.save()
+        try:
+            bill = post_electricity_payment(bill_id, paid_amount, paid_date)
+        except ElectricityBill.DoesNotExist:
+            return JsonResponse({'success': False, 'message': 'Bill not found'}, status=404)
         
         return JsonResponse({
             'success': True,
@@ -1203,15 +1373,36 @@ def record_electricity_payment(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(PAYMENTS, ROOMS))
 def get_payment_history(request, room_id):
-    """Get payment history for a room"""
+    """
+    Get payment history for a room, newest month first.
+
+    Optional ?from=YYYY-MM and ?to=YYYY-MM bound the months (inclusive) and
+    ?limit caps how many months are returned (default 24, max 120).
+    """
     try:
         room = get_object_or_404(Room, id=room_id)
-        payments = MonthlyPayment.objects.filter(room=room).order_by('-month')
+        try:
+            month_from = datetime.strptime(request.GET['from'], '%Y-%m').date() if request.GET.get('from') else None
+            month_to = datetime.strptime(request.GET['to'], '%Y-%m').date() if request.GET.get('to') else None
+            limit = min(max(int(request.GET.get('limit', PAYMENT_HISTORY_LIMIT)), 1), PAYMENT_HISTORY_MAX_LIMIT)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Use YYYY-MM for from/to and a number for limit'}, status=400)
+
+        payments = MonthlyPayment.objects.filter(room=room)
+        if month_from:
+            payments = payments.filter(month__gte=month_from)
+        if month_to:
+            payments = payments.filter(month__lte=month_to)
+        # All records for the window come from one extra query
+        payments = list(payments.order_by('-month').prefetch_related(
+            Prefetch('payment_records', queryset=PaymentRecord.objects.order_by('-payment_date'))
+        )[:limit + 1])
+        has_more = len(payments) > limit
         
         history = []
-        for payment in payments:
-            records = PaymentRecord.objects.filter(monthly_payment=payment).order_by('-payment_date')
+        for payment in payments[:limit]:
             history.append({
                 'id': payment.id,
                 'month': payment.month.strftime('%B %Y'),
@@ -1225,13 +1416,14 @@ def get_payment_history(request, room_id):
                     'amount': str(r.payment_amount),
                     'method': r.get_payment_method_display(),
                     'ref': r.reference_number,
-                } for r in records]
+                } for r in payment.payment_records.all()]
             })
         
         return JsonResponse({
             'success': True,
             'room': room.number,
-            'history': history
+            'history': history,
+            'has_more': has_more,
         })
     except Exception as e:
         return JsonResponse({
@@ -1255,19 +1447,20 @@ def booking_page(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(ROOMS))
 def get_available_rooms(request):
     """Get list of available rooms"""
     try:
-        # Get only available rooms
-        available_rooms = Room.objects.filter(is_available=True)
-        
-        rooms_data = [{
+        # Get only rooms that are marked available and still have a free slot
+        rooms_data = cached('available_rooms', (ROOMS,), lambda: [{
             'id': room.id,
             'number': room.number,
             'room_type': room.get_room_type_display(),
             'price': str(room.price),
-            'agreed_rent': str(room.agreed_rent) if room.agreed_rent is not None else None
-        } for room in available_rooms]
+            'agreed_rent': str(room.agreed_rent) if room.agreed_rent is not None else None,
+            'capacity': room.capacity,
+            'free_slots': room.free_slots,
+        } for room in Room.objects.bookable()])
         
         return JsonResponse({
             'success': True,
@@ -1280,14 +1473,49 @@ def get_available_rooms(request):
         }, status=400)
 
 
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_http_methods(["GET"])
+def get_availability(request):
+    """
+    Free slots per room for each day of ?from=YYYY-MM-DD to ?to=YYYY-MM-DD
+    (inclusive; defaults to the next 30 days, at most a year), optionally for
+    one ?building. `free[i]` is the count for `from` + i days.
+    """
+    try:
+        start = datetime.strptime(request.GET['from'], '%Y-%m-%d').date() if request.GET.get('from') else date.today()
+        end = datetime.strptime(request.GET['to'], '%Y-%m-%d').date() if request.GET.get('to') else start + timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Use YYYY-MM-DD for from/to'}, status=400)
+    if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+        return JsonResponse({
+            'success': False,
+            'message': f'to must be on or after from, and at most {AVAILABILITY_MAX_DAYS} days later'
+        }, status=400)
+
+    building = request.GET.get('building', '')
+    rooms = Room.objects.filter(building=building) if building else Room.objects.all()
+    room_rows = cached(
+        f'availability:{start.isoformat()}:{end.isoformat()}:{building}',
+        (ROOMS, GUESTS, BOOKINGS),
+        lambda: free_slots(start, end, rooms),
+    )
+    return JsonResponse({
+        'success': True,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': (end - start).days + 1,
+        'rooms': room_rows,
+    })
+
+
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["POST"])
+@idempotent
 def submit_booking(request):
     """Submit booking with guest information"""
     try:
-        from dateutil.relativedelta import relativedelta
-        
         # Parse form data
         room_id = request.POST.get('room_id')
         first_name = request.POST.get('first_name', '').strip()
@@ -1377,40 +1605,25 @@ def submit_booking(request):
                 is_active=True
             )
         
-        guest.check_in_date = check_in
-        guest.check_out_date = check_out
-        guest.room = room
-        guest.save()
-        
-        # Create or update booking
-        booking = Booking.objects.create(
-            room=room,
-            customer_name=f"{first_name} {last_name}",
-            check_in=check_in,
-            check_out=check_out,
-            created_by=request.user if request.user.is_authenticated else None,
-            is_active=True
-        )
-        
-        # Create monthly payment record if needed
-        current = check_in.replace(day=1)
-        # When creating monthly payments for the booking range prefer agreed_rent if set
-        while current < check_out:
-            monthly_payment, created = MonthlyPayment.objects.get_or_create(
+        with transaction.atomic():
+            previous_room_id = guest.room_id
+            guest.check_in_date = check_in
+            guest.check_out_date = check_out
+            room = assign_room(guest, room.id)
+            guest.save()
+            refresh_occupancy(previous_room_id, room.id)
+
+            booking = Booking.objects.create(
                 room=room,
-                month=current,
-                defaults={
-                    'guest': guest,
-                    'rent_amount': (room.agreed_rent if getattr(room, 'agreed_rent', None) is not None else room.price),
-                    'paid_amount': 0,
-                    'payment_status': 'pending',
-                }
+                customer_name=f"{first_name} {last_name}",
+                check_in=check_in,
+                check_out=check_out,
+                created_by=request.user if request.user.is_authenticated else None,
+                is_active=True
             )
-            if created:
-                monthly_payment.guest = guest
-                monthly_payment.save()
-            
-            current = current + relativedelta(months=1)
+
+            # One query for the months already billed, one insert for the rest
+            bill_stay(room, guest, check_in, check_out)
         
         console_log_data = {
             'action': 'booking_created',
@@ -1430,6 +1643,11 @@ def submit_booking(request):
             'guest_id': guest.id
         })
         
+    except RoomFullError as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
     except Exception as e:
         print(f"✗ Booking error: {str(e)}")
         return JsonResponse({
@@ -1441,6 +1659,7 @@ def submit_booking(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(GUESTS, ROOMS))
 def get_room_tenants(request, room_id):
     """Get current and past tenants for a room"""
     try:
@@ -1467,9 +1686,9 @@ def get_room_tenants(request, room_id):
                 'country': guest.country,
                 'zip_code': guest.zip_code,
                 'notes': guest.notes,
-                'lpu_id': guest.lpu_id if hasattr(guest, 'lpu_id') else '',
-                'id_proof_image': guest.id_proof_image.url if guest.id_proof_image else None,
-                'lpu_id_photo': guest.lpu_id_photo.url if guest.lpu_id_photo else None,
+                'college_id': guest.college_id,
+                'govt_id_photo': guest.govt_id_photo.url if guest.govt_id_photo else None,
+                'college_id_photo': guest.college_id_photo.url if guest.college_id_photo else None,
                 'document_verification_image': guest.document_verification_image.url if guest.document_verification_image else None
             })
         
@@ -1488,6 +1707,7 @@ def get_room_tenants(request, room_id):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(ROOMS))
 def get_room_details(request, room_id):
     """Return basic room details for booking UI (price, agreed_rent, description)"""
     try:
@@ -1507,6 +1727,7 @@ def get_room_details(request, room_id):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 @require_http_methods(["GET"])
+@condition(etag_func=generation_etag(ELECTRICITY, ROOMS))
 def get_electricity_history(request, room_id):
     """Get electricity bill history for a room"""
     try:
@@ -1560,21 +1781,24 @@ def update_payment_record(request, record_id):
             
         record.payment_method = request.POST.get('payment_method', record.payment_method)
         record.notes = request.POST.get('notes', record.notes)
-        record.save()
-        
-        # Recalculate total paid for the month
-        total_paid = PaymentRecord.objects.filter(monthly_payment=monthly_payment).aggregate(
-            total=Sum('payment_amount'))['total'] or Decimal('0.00')
-        
-        monthly_payment.paid_amount = total_paid
-        # Update status
-        if monthly_payment.paid_amount >= monthly_payment.rent_amount:
-            monthly_payment.payment_status = 'paid'
-        elif monthly_payment.paid_amount > 0:
-            monthly_payment.payment_status = 'partial'
-        else:
-            monthly_payment.payment_status = 'pending'
-        monthly_payment.save()
+        
+        with transaction.atomic():
+            record.save()
+            
+            # Recalculate total paid for the month
+            total_paid = PaymentRecord.objects.filter(monthly_payment=monthly_payment).aggregate(
+                total=Sum('payment_amount'))['total'] or Decimal('0.00')
+            
+            monthly_payment.paid_amount = total_paid
+            # Update status
+            if monthly_payment.paid_amount >= monthly_payment.rent_amount:
+                monthly_payment.payment_status = 'paid'
+            elif monthly_payment.paid_amount > 0:
+                monthly_payment.payment_status = 'partial'
+            else:
+                monthly_payment.payment_status = 'pending'
+            monthly_payment.save()
+            refresh_room_collections(monthly_payment.room_id, [monthly_payment.month])
         
         return JsonResponse({'success': True, 'message': 'Payment record updated'})
     except Exception as e:
@@ -1588,20 +1812,23 @@ def delete_payment_record(request, record_id):
     try:
         record = get_object_or_404(PaymentRecord, id=record_id)
         monthly_payment = record.monthly_payment
-        record.delete()
-        
-        # Recalculate
-        total_paid = PaymentRecord.objects.filter(monthly_payment=monthly_payment).aggregate(
-            total=Sum('payment_amount'))['total'] or Decimal('0.00')
         
-        monthly_payment.paid_amount = total_paid
-        if monthly_payment.paid_amount >= monthly_payment.rent_amount:
-            monthly_payment.payment_status = 'paid'
-        elif monthly_payment.paid_amount > 0:
-            monthly_payment.payment_status = 'partial'
-        else:
-            monthly_payment.payment_status = 'pending'
-        monthly_payment.save()
+        with transaction.atomic():
+            record.delete()
+            
+            # Recalculate
+            total_paid = PaymentRecord.objects.filter(monthly_payment=monthly_payment).aggregate(
+                total=Sum('payment_amount'))['total'] or Decimal('0.00')
+            
+            monthly_payment.paid_amount = total_paid
+            if monthly_payment.paid_amount >= monthly_payment.rent_amount:
+                monthly_payment.payment_status = 'paid'
+            elif monthly_payment.paid_amount > 0:
+                monthly_payment.payment_status = 'partial'
+            else:
+                monthly_payment.payment_status = 'pending'
+            monthly_payment.save()
+            refresh_room_collections(monthly_payment.room_id, [monthly_payment.month])
         
         return JsonResponse({'success': True, 'message': 'Payment record deleted'})
     except Exception as e:
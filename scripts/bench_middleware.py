@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of per-request middleware overhead.
+
+Runs each middleware around a view that returns an empty response and prints
+the cost per request, without the database, templates or URL resolving.
+
+    python scripts/bench_middleware.py [--requests 100000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import django
+
+# Setup Django environment
+sys.path.append(os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hotel_project.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from hotel_project.middleware import LoginRequiredMiddleware, SecurityHeadersMiddleware
+
+PATHS = ('/', '/api/guests/', f'{settings.STATIC_URL}rental/js/utils.js', '/manage-guests/')
+
+
+def empty_view(request):
+    return HttpResponse()
+
+
+def make_request(path):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    return request
+
+
+def bench(name, middleware, number):
+    for path in PATHS:
+        request = make_request(path)
+        seconds = timeit.timeit(lambda: middleware(request), number=number)
+        print(f"{name:<28} {path:<36} {seconds / number * 1e6:8.2f} µs/request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100_000, help='Requests timed per path')
+    number = parser.parse_args().requests
+
+    bench('baseline (view only)', empty_view, number)
+    bench('LoginRequiredMiddleware', LoginRequiredMiddleware(empty_view), number)
+    bench('SecurityHeadersMiddleware', SecurityHeadersMiddleware(empty_view), number)
+
+
+if __name__ == '__main__':
+    main()